@@ -0,0 +1,114 @@
+"""
+HSNW Dashboard - parallel ingest benchmark
+Times the two slow steps of loading the raw readings, parsing the CSV (with the timestamp conversion and the
+sensor join) and building the rollups, with 1 process (the serial path) and with each number of worker
+processes given, on a synthetic dataset. Every parallel result is checked against the serial one. The speedup
+of each worker count over the serial path is printed and written as JSON with the core count of the machine.
+
+Usage: python benchmarks/ingest_speedup.py --locations 17 --years 3 --workers 2 4 8 --out ingest.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic_data
+from run_benchmarks import get_git_commit, get_versions
+
+
+def get_default_workers():
+    """2, 4, 8, ... below the number of CPU cores, and the core count itself (2 on a single core)."""
+    cpus = os.cpu_count() or 1
+    workers = [2 ** i for i in range(1, cpus.bit_length()) if 2 ** i < cpus]
+    return workers + [cpus] if cpus > 1 else [2]
+
+
+def time_best(func, repeat):
+    """Fastest of `repeat` calls in seconds, and the last result."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds), result
+
+
+def check_rollups(expected, readings_rollups):
+    for duration, rollup in expected.items():
+        # Bins split across chunks sum their readings in another order: allow float32 rounding
+        pd.testing.assert_frame_equal(rollup.frame, readings_rollups[duration].frame, check_exact=False, rtol=1e-6)
+        assert rollup.offsets == readings_rollups[duration].offsets, duration
+
+
+def run(args):
+    data_dir = args.data_dir
+    if data_dir is None:
+        data_dir = os.path.join("bench_data", f"{args.locations}loc_{args.start}_{synthetic_data.get_end(args)}")
+    if not os.path.exists(os.path.join(data_dir, "sensors.csv")):
+        print(f"Generating synthetic data in {data_dir}")
+        synthetic_data.generate(data_dir, args.locations, args.start, synthetic_data.get_end(args), args.seed)
+    os.environ["HSNW_DATA_DIR"] = os.path.abspath(data_dir)
+    import sensor_store
+    import rollups
+
+    sensors = sensor_store.read_sensors()
+    results = []
+    expected_readings = expected_rollups = None
+    for workers in [1] + args.workers:
+        parse_seconds, readings = time_best(
+            lambda: sensor_store.read_raw_readings(sensors=sensors, workers=workers), args.repeat)
+        frame = rollups.LocationIndex(readings).frame
+        rollup_seconds, readings_rollups = time_best(lambda: rollups.build_rollups(frame, workers), args.repeat)
+        if expected_readings is None:
+            expected_readings, expected_rollups = readings, readings_rollups
+        else:
+            pd.testing.assert_frame_equal(expected_readings, readings)
+            check_rollups(expected_rollups, readings_rollups)
+        results.append(dict(workers=workers, parse_seconds=parse_seconds, rollup_seconds=rollup_seconds,
+                            total_seconds=parse_seconds + rollup_seconds))
+
+    serial = results[0]
+    print(f"{len(expected_readings)} readings, {os.cpu_count()} CPU cores")
+    print(f"{'workers':>8}{'parse s':>10}{'rollups s':>11}{'total s':>10}{'speedup':>9}")
+    for result in results:
+        for step in ["parse", "rollup", "total"]:
+            result[f"{step}_speedup"] = serial[f"{step}_seconds"] / result[f"{step}_seconds"]
+        print(f"{result['workers']:>8}{result['parse_seconds']:>10.2f}{result['rollup_seconds']:>11.2f}"
+              f"{result['total_seconds']:>10.2f}{result['total_speedup']:>8.2f}x")
+
+    return dict(
+        commit=get_git_commit(),
+        timestamp=pd.Timestamp.now(tz="UTC").isoformat(),
+        machine=dict(platform=platform.platform(), processor=platform.processor(), cpus=os.cpu_count()),
+        versions=get_versions(),
+        dataset=dict(data_dir=data_dir, readings=len(expected_readings),
+                     locations=len(expected_rollups['2'].locations),
+                     first_date=str(expected_readings["Date"].min()), last_date=str(expected_readings["Date"].max()),
+                     seed=args.seed),
+        parameters=dict(repeat=args.repeat, chunk_days=rollups.CHUNK_DAYS,
+                        chunks_per_worker=sensor_store.CHUNKS_PER_WORKER),
+        results=results,
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the serial and parallel ingest of the raw readings.")
+    synthetic_data.add_arguments(parser)
+    parser.add_argument("--data-dir", help="existing dataset directory (sensors.csv and raw readings CSV); "
+                                           "generated from the options above if not given")
+    parser.add_argument("--workers", type=int, nargs="+", default=get_default_workers(),
+                        help="worker process counts to compare with the serial path (default: powers of 2 up to "
+                             "the number of CPU cores)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per step (the fastest is kept)")
+    parser.add_argument("--out", default="ingest_speedup.json", help="output JSON file")
+    args = parser.parse_args()
+    report = run(args)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
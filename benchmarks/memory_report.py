@@ -0,0 +1,69 @@
+"""
+HSNW Dashboard - memory report
+Compares the memory held by the dashboard's data in the previous representation (object location strings,
+float64 measurements, int64 sensor ids and a date-object copy of the daily rollup for the date picker) with
+the compact one (categorical locations, float32 measurements, int32 sensor ids, no daily copy).
+Sizes are deep pandas memory usage, i.e. including the location strings, and are per gunicorn worker.
+
+Usage: HSNW_DATA_DIR=bench_data/... python benchmarks/memory_report.py --out memory.json
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sensor_store
+import rollups
+import derived_metrics
+
+DURATION_NAMES = {'1': "weekly", '2': "daily", '3': "12-hr", '4': "6-hr", '5': "3-hr", '6': "hourly", '7': "5-min"}
+
+
+def frame_bytes(frame):
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+def measure(sensors, compact):
+    """Bytes of the readings, each rollup level and the date picker copy in one representation."""
+    if sensor_store.store_exists():
+        readings = sensor_store.load_readings(sensors=sensors, compact=compact)
+    else:
+        readings = sensor_store.read_raw_readings(sensors=sensors, compact=compact)
+    readings = rollups.LocationIndex(readings).frame
+    readings_rollups = rollups.build_rollups(readings)
+    for rollup in readings_rollups.values():
+        derived_metrics.add_derived_columns(rollup.frame)
+
+    sizes = {"readings": frame_bytes(readings)}
+    for duration, name in DURATION_NAMES.items():
+        sizes[f"rollup {name}"] = frame_bytes(readings_rollups[duration].frame)
+    if not compact:
+        readings_day = readings_rollups['2'].frame.copy()
+        readings_day["Date"] = readings_day["Date"].dt.date
+        sizes["readings_day"] = frame_bytes(readings_day)
+    sizes["total"] = sum(sizes.values())
+    return len(readings), sizes
+
+
+def format_size(n):
+    return f"{n / 2**20:10.1f} MiB"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the memory footprint of the readings representations.")
+    parser.add_argument("--out", help="also write the report as JSON to this file")
+    args = parser.parse_args()
+    sensors = sensor_store.read_sensors()
+    n_readings, previous = measure(sensors, compact=False)
+    _, compact = measure(sensors, compact=True)
+
+    print(f"{n_readings} readings from {sensor_store.DATA_DIR}")
+    print(f"{'':20}{'previous':>14}{'compact':>14}{'saved':>8}")
+    for name, size in previous.items():
+        new_size = compact.get(name, 0)
+        print(f"{name:20}{format_size(size)}{format_size(new_size)}{1 - new_size / size:8.0%}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(dict(data_dir=sensor_store.DATA_DIR, readings=n_readings, previous_bytes=previous,
+                           compact_bytes=compact), f, indent=2)
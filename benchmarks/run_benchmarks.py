@@ -0,0 +1,223 @@
+"""
+HSNW Dashboard - benchmark suite
+Generates (or reuses) a synthetic dataset, loads the dashboard on it and times get_readings_slice and the
+chart callback (update_time_series, building the full figure) for every metric x duration x smoothing
+combination, plus the map callback. The result cache is cleared before every timed call, so the numbers are
+cold-cache latencies; one warm call per combination is timed separately. The chart of every combination is
+also built with each renderer (SVG with JSON lists, WebGL with base64 typed arrays) to compare their payload
+size and serialization time.
+Results (latency percentiles, peak memory, payload bytes, and the dataset and environment) are written as
+JSON so that runs on different commits can be compared.
+
+Usage: python benchmarks/run_benchmarks.py --locations 17 --years 1 --repeat 5 --out benchmark.json
+"""
+import os
+import sys
+import json
+import base64
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+import importlib.util
+import dash
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic_data
+
+APP_PATH = os.path.join(REPO_DIR, "sp24-hsnw-dash-app.py")
+METRICS = ['1', '2', '3', '4', '5', '6', '7']
+DURATIONS = ['1', '2', '3', '4', '5', '6', '7']
+SMOOTHINGS = ['1', '2', '3', '4']
+RENDERERS = {"svg": None, "webgl": 0} # WEBGL_POINT_THRESHOLD forcing each renderer
+
+
+def load_app(data_dir):
+    """Import the dashboard module with its data read from data_dir (building the store if needed)."""
+    os.environ["HSNW_DATA_DIR"] = data_dir
+    import sensor_store
+    if not sensor_store.store_exists():
+        sensor_store.build_store()
+    spec = importlib.util.spec_from_file_location("hsnw_app", APP_PATH)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    if getattr(app, "ingester", None) is not None:
+        app.ingester.stop()
+    return app
+
+
+def get_percentiles(seconds):
+    seconds = np.asarray(seconds)
+    return dict(p50=float(np.percentile(seconds, 50)), p90=float(np.percentile(seconds, 90)),
+                p99=float(np.percentile(seconds, 99)), max=float(seconds.max()), n=len(seconds))
+
+
+def time_call(func, repeat, before=None):
+    """Returns the seconds of each of `repeat` calls and the last result; before() runs untimed before each call."""
+    seconds = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+    return seconds, result
+
+
+def get_peak_memory(func, before=None):
+    """Peak bytes allocated by Python while func runs."""
+    if before is not None:
+        before()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def to_json(figure):
+    import plotly
+    return json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def time_serialization(figure):
+    start = time.perf_counter()
+    payload = to_json(figure)
+    return time.perf_counter() - start, len(payload.encode())
+
+
+def count_points(figure):
+    # WebGL charts are dicts whose traces hold typed arrays: 8 bytes per date
+    if isinstance(figure, dict):
+        return sum(len(base64.b64decode(trace["x"]["bdata"])) // 8 for trace in figure["data"]
+                   if trace["type"] == "scattergl")
+    return sum(len(trace.x) for trace in figure.data if trace.x is not None)
+
+
+def bench_combination(app, metric, duration, smoothen, start_date, end_date, repeat, memory):
+    field_mean, field_name, _, _ = app.get_metric_field_names(metric)
+    clear = app.results_cache.clear
+
+    def readings_slice():
+        return app.get_readings_slice(metric, duration, smoothen, start_date, end_date, field_mean, field_name)
+
+    def time_series():
+        figure, chart_state, chart_request, _ = app.update_time_series(
+            None, metric, duration, smoothen, start_date, end_date, None)
+        if chart_request is not dash.no_update: # uncached charts are built by the background callback
+            figure, chart_state = app.build_time_series(lambda progress: None, chart_request)
+        return figure, chart_state
+
+    slice_seconds, df = time_call(readings_slice, repeat, clear)
+    chart_seconds, (figure, _) = time_call(time_series, repeat, clear)
+    warm_seconds, _ = time_call(time_series, 1)
+    serialize_seconds, payload_bytes = time_serialization(figure)
+
+    renderers = {}
+    threshold = app.WEBGL_POINT_THRESHOLD
+    for renderer, renderer_threshold in RENDERERS.items():
+        app.WEBGL_POINT_THRESHOLD = renderer_threshold
+        build_seconds, (renderer_figure, _) = time_call(time_series, 1, clear)
+        seconds, size = time_serialization(renderer_figure)
+        renderers[renderer] = dict(build_seconds=build_seconds[0], serialize_seconds=seconds, payload_bytes=size)
+    app.WEBGL_POINT_THRESHOLD = threshold
+
+    result = dict(metric=metric, duration=duration, smoothen=smoothen, rows=len(df), points=count_points(figure),
+                  renderer="webgl" if app.is_webgl_chart(figure) else "svg",
+                  get_readings_slice=get_percentiles(slice_seconds),
+                  update_time_series=get_percentiles(chart_seconds),
+                  update_time_series_cached=warm_seconds[0],
+                  serialize_seconds=serialize_seconds, payload_bytes=payload_bytes, renderers=renderers)
+    if memory:
+        result["peak_memory_bytes"] = dict(get_readings_slice=get_peak_memory(readings_slice, clear),
+                                           update_time_series=get_peak_memory(time_series, clear))
+    return result
+
+
+def bench_spatial_view(app, start_date, end_date, repeat):
+    seconds, patched = time_call(lambda: app.update_spatial_view(start_date, end_date), repeat,
+                                 app.results_cache.clear)
+    return dict(update_spatial_view=get_percentiles(seconds),
+                payload_bytes=len(to_json(patched.to_plotly_json()).encode()))
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_versions():
+    import plotly, pyarrow
+    return dict(python=platform.python_version(), numpy=np.__version__, pandas=pd.__version__,
+                pyarrow=pyarrow.__version__, plotly=plotly.__version__, dash=dash.__version__)
+
+
+def run(args):
+    data_dir = args.data_dir
+    if data_dir is None:
+        data_dir = os.path.join("bench_data", f"{args.locations}loc_{args.start}_{synthetic_data.get_end(args)}")
+    if not os.path.exists(os.path.join(data_dir, "sensors.csv")):
+        print(f"Generating synthetic data in {data_dir}")
+        synthetic_data.generate(data_dir, args.locations, args.start, synthetic_data.get_end(args), args.seed)
+
+    start = time.perf_counter()
+    app = load_app(os.path.abspath(data_dir))
+    load_seconds = time.perf_counter() - start
+    start_date = args.start_date or str(app.first_day)
+    end_date = args.end_date or str(app.last_day)
+
+    results = []
+    for metric in args.metrics:
+        for duration in args.durations:
+            for smoothen in SMOOTHINGS:
+                results.append(bench_combination(app, metric, duration, smoothen, start_date, end_date,
+                                                 args.repeat, not args.no_memory))
+                renderers = results[-1]["renderers"]
+                print(f"metric {metric} duration {duration} smoothen {smoothen}: "
+                      f"chart p50 {results[-1]['update_time_series']['p50'] * 1000:.1f} ms, payload "
+                      f"svg {renderers['svg']['payload_bytes'] / 1024:.0f} KiB "
+                      f"({renderers['svg']['serialize_seconds'] * 1000:.1f} ms) / "
+                      f"webgl {renderers['webgl']['payload_bytes'] / 1024:.0f} KiB "
+                      f"({renderers['webgl']['serialize_seconds'] * 1000:.1f} ms)")
+
+    return dict(
+        commit=get_git_commit(),
+        timestamp=pd.Timestamp.now(tz="UTC").isoformat(),
+        machine=dict(platform=platform.platform(), processor=platform.processor(), cpus=os.cpu_count()),
+        versions=get_versions(),
+        dataset=dict(data_dir=data_dir, locations=len(app.readings_rollups['2'].locations),
+                     readings=len(app.readings), first_date=str(app.readings["Date"].min()),
+                     last_date=str(app.readings["Date"].max()), seed=args.seed),
+        parameters=dict(repeat=args.repeat, start_date=start_date, end_date=end_date,
+                        webgl_point_threshold=app.WEBGL_POINT_THRESHOLD),
+        load_seconds=load_seconds,
+        spatial_view=bench_spatial_view(app, start_date, end_date, args.repeat),
+        results=results,
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard callbacks on synthetic data.")
+    synthetic_data.add_arguments(parser)
+    parser.add_argument("--data-dir", help="existing dataset directory (sensors.csv and raw readings CSV); "
+                                           "generated from the options above if not given")
+    parser.add_argument("--repeat", type=int, default=5, help="timed calls per combination")
+    parser.add_argument("--metrics", nargs="+", default=METRICS)
+    parser.add_argument("--durations", nargs="+", default=DURATIONS)
+    parser.add_argument("--start-date", help="first day shown (default: first day of the data)")
+    parser.add_argument("--end-date", help="last day shown (default: last day of the data)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory pass")
+    parser.add_argument("--out", default="benchmark.json", help="output JSON file")
+    args = parser.parse_args()
+    report = run(args)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
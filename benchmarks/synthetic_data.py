@@ -0,0 +1,113 @@
+"""
+HSNW Dashboard - synthetic sensor network data for benchmarks
+Writes a sensors.csv and an iu_temp_data_truncated.csv with the same schema as the files in Data/,
+for any number of locations and any date range at 5-minute resolution. The first locations reuse the
+real campus locations; further ones are named "Synthetic Site <n>" and placed around campus.
+Readings follow a daily temperature cycle with noise, and about 2% of the readings are dropped to mimic
+sensor gaps. The output is deterministic for a given seed.
+
+Usage: python benchmarks/synthetic_data.py --locations 17 --start 2023-05-01 --end 2023-09-30 --out bench_data
+"""
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+SENSOR_COLUMNS = ["sensorid", "name", "serial", "model", "location", "sublocation", "latitude", "longitude",
+                  "deploy_date", "depth_height", "lcz", "class", "mount", "rmsid", "region", "status",
+                  "new_sensorid"]
+READING_COLUMNS = ["#", "Date Time", "Temp", "RH", "DewPt", "Status", "Sensor Id"]
+CAMPUS_LOCATIONS = ["Fee Ln", "Wells Library Parking Lot", "Woodlawn", "Campus River", "Myles Brand Parking Lot",
+                    "Woodlawn Field", "Jordan River Auditorium", "Biology Building", "Dunn Meadow", "Dunn Woods",
+                    "Merrill Hall", "Cravens Hall Bus Stop", "Hodge Hall Bus Stop", "Opposite Teter Quad",
+                    "Luddy Hall Parking Lot", "Willie Streeter Community Garden", "Bloomington Community Orchard"]
+
+
+def generate_sensors(n_locations, seed=0):
+    rng = np.random.default_rng(seed)
+    names = [CAMPUS_LOCATIONS[i] if i < len(CAMPUS_LOCATIONS) else f"Synthetic Site {i + 1}"
+             for i in range(n_locations)]
+    sensors = pd.DataFrame({
+        "sensorid": np.arange(1, n_locations + 1),
+        "name": [f"TRH_SYN_{i + 1}" for i in range(n_locations)],
+        "serial": 20000000 + np.arange(n_locations),
+        "model": "MX2302A",
+        "location": names,
+        "sublocation": "(0, 0)",
+        "latitude": (39.1688 + rng.uniform(-0.006, 0.006, n_locations)).round(6),
+        "longitude": (-86.5210 + rng.uniform(-0.008, 0.008, n_locations)).round(6),
+        "deploy_date": "2018-12-04",
+        "depth_height": 6,
+        "lcz": "compact midrise",
+        "class": "temperature",
+        "mount": "pole_mount",
+        "rmsid": "",
+        "region": "iucampus",
+        "status": "ACTIVE",
+        "new_sensorid": "",
+    })
+    return sensors[SENSOR_COLUMNS]
+
+
+def generate_readings(sensor_id, dates, rng):
+    """Readings of one sensor: a daily and seasonal temperature cycle plus noise, with ~2% of readings missing."""
+    dates = dates[rng.random(len(dates)) > 0.02]
+    hours = dates.hour.to_numpy() + dates.minute.to_numpy() / 60
+    season = -np.cos((dates.dayofyear.to_numpy() - 15) / 365.25 * 2 * np.pi)
+    temperature = 55 + 25 * season + 10 * np.sin((hours - 9) / 24 * 2 * np.pi) + rng.normal(0, 2, len(dates))
+    humidity = np.clip(65 - 20 * np.sin((hours - 9) / 24 * 2 * np.pi) + rng.normal(0, 6, len(dates)), 5, 100)
+    dew_point = temperature - (100 - humidity) / 5 * 9 / 5
+    return pd.DataFrame({
+        "#": 0,
+        "Date Time": dates.strftime("%Y-%m-%d %H:%M:%S"),
+        "Temp": temperature.round(2),
+        "RH": humidity.round(2),
+        "DewPt": dew_point.round(2),
+        "Status": "",
+        "Sensor Id": sensor_id,
+    })[READING_COLUMNS]
+
+
+def generate(out_dir, n_locations=17, start="2023-05-01", end="2023-09-30", seed=0):
+    """Write sensors.csv and iu_temp_data_truncated.csv to out_dir; returns the number of readings written."""
+    os.makedirs(out_dir, exist_ok=True)
+    sensors = generate_sensors(n_locations, seed)
+    sensors.to_csv(os.path.join(out_dir, "sensors.csv"), index=False)
+
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, pd.Timestamp(end) + pd.Timedelta(hours=23, minutes=55), freq="5min")
+    n_readings = 0
+    with open(os.path.join(out_dir, "iu_temp_data_truncated.csv"), "w", newline="") as f:
+        f.write(",".join(READING_COLUMNS) + "\n")
+        # One sensor and one month at a time, to keep memory flat for multi-year datasets
+        for sensor_id in sensors["sensorid"]:
+            for _, month_dates in pd.Series(dates, index=dates).groupby(dates.to_period("M")):
+                readings = generate_readings(sensor_id, pd.DatetimeIndex(month_dates), rng)
+                readings["#"] = np.arange(n_readings, n_readings + len(readings))
+                readings.to_csv(f, header=False, index=False)
+                n_readings += len(readings)
+    return n_readings
+
+
+def add_arguments(parser):
+    parser.add_argument("--locations", type=int, default=17, help="number of sensor locations")
+    parser.add_argument("--start", default="2023-05-01", help="first day of readings")
+    parser.add_argument("--end", default="2023-09-30", help="last day of readings")
+    parser.add_argument("--years", type=float, help="number of years of readings from --start (overrides --end)")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def get_end(args):
+    if args.years is None:
+        return args.end
+    return (pd.Timestamp(args.start) + pd.DateOffset(days=round(args.years * 365.25)) - pd.Timedelta(days=1))\
+        .strftime("%Y-%m-%d")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic sensor network dataset.")
+    add_arguments(parser)
+    parser.add_argument("--out", default="bench_data", help="output directory")
+    args = parser.parse_args()
+    n = generate(args.out, args.locations, args.start, get_end(args), args.seed)
+    print(f"Wrote {args.locations} sensors and {n} readings to {args.out}")
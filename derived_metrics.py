@@ -0,0 +1,87 @@
+"""
+HSNW Dashboard - derived metrics
+Heat indices computed from the measurement columns as whole-column NumPy expressions.
+Temperatures and dew points are in Fahrenheit and relative humidity in percent.
+New indices are added with register_metric(name, func, inputs); func receives one array per input column.
+"""
+import numpy as np
+
+HEAT_INDEX_COEFFICIENTS = [-42.379, 2.04901523, 10.14333127, -0.22475541, -6.83783e-3,
+                           -5.481717e-2, 1.22874e-3, 8.5282e-4, -1.99e-6]
+
+
+def heat_index(temperature, humidity):
+    """Rothfusz regression, used for all readings."""
+    c = HEAT_INDEX_COEFFICIENTS
+    t2 = temperature ** 2
+    r2 = humidity ** 2
+    return c[0] + c[1]*temperature + c[2]*humidity + c[3]*temperature*humidity + c[4]*t2 + c[5]*r2 + \
+        c[6]*t2*humidity + c[7]*temperature*r2 + c[8]*t2*r2
+
+
+def nws_heat_index(temperature, humidity):
+    """
+    NWS heat index: Steadman's simple formula below 80F, otherwise the Rothfusz regression with the
+    low humidity and high humidity adjustments.
+    """
+    temperature = np.asarray(temperature, dtype=float)
+    humidity = np.asarray(humidity, dtype=float)
+    simple = 0.5 * (temperature + 61.0 + (temperature - 68.0) * 1.2 + humidity * 0.094)
+    rothfusz = heat_index(temperature, humidity)
+
+    dry = (humidity < 13) & (temperature >= 80) & (temperature <= 112)
+    dry_adjustment = ((13 - humidity) / 4) * np.sqrt(np.clip(17 - np.abs(temperature - 95), 0, None) / 17)
+    rothfusz = np.where(dry, rothfusz - dry_adjustment, rothfusz)
+    humid = (humidity > 85) & (temperature >= 80) & (temperature <= 87)
+    rothfusz = np.where(humid, rothfusz + ((humidity - 85) / 10) * ((87 - temperature) / 5), rothfusz)
+
+    return np.where((simple + temperature) / 2 < 80, simple, rothfusz)
+
+
+def humidex(temperature, dewpoint):
+    """Humidex in Celsius."""
+    temp_celsius = (temperature - 32) * 5/9
+    dewpoint_celsius = (dewpoint - 32) * 5/9
+    e = 6.11 * np.exp(5417.7530 * (1 / 273.15 - 1 / (273.15 + dewpoint_celsius)))
+    return temp_celsius + 0.5555 * (e - 10.0)
+
+
+def wet_bulb_globe_temperature(temperature, humidity):
+    """
+    Estimated WBGT in Fahrenheit for shaded conditions (Australian Bureau of Meteorology approximation),
+    since the sensors do not measure solar radiation or wind.
+    """
+    temp_celsius = (temperature - 32) * 5/9
+    vapour_pressure = humidity / 100 * 6.105 * np.exp(17.27 * temp_celsius / (237.7 + temp_celsius))
+    wbgt_celsius = 0.567 * temp_celsius + 0.393 * vapour_pressure + 3.94
+    return wbgt_celsius * 9/5 + 32
+
+
+# Derived metric name -> (function, measurement columns passed to it)
+DERIVED_METRICS = {
+    "Heat Index": (heat_index, ["Temperature", "Rel Humidity"]),
+    "Humidex": (humidex, ["Temperature", "Dew Point"]),
+    "NWS Heat Index": (nws_heat_index, ["Temperature", "Rel Humidity"]),
+    "WBGT": (wet_bulb_globe_temperature, ["Temperature", "Rel Humidity"]),
+}
+
+
+def register_metric(name, func, inputs):
+    DERIVED_METRICS[name] = (func, list(inputs))
+
+
+def compute_metric(frame, name, suffix="_mean"):
+    """Compute a derived metric from the `<input><suffix>` columns of frame; returns a NumPy array."""
+    func, inputs = DERIVED_METRICS[name]
+    return func(*[frame[column + suffix].to_numpy(dtype=float) for column in inputs])
+
+
+def add_derived_columns(frame, names=None, suffix="_mean"):
+    """
+    Add a `<name><suffix>` column to frame for each derived metric (all of them by default), in the float
+    type of its input columns.
+    """
+    for name in (DERIVED_METRICS if names is None else names):
+        dtype = np.result_type(*[frame[column + suffix].dtype for column in DERIVED_METRICS[name][1]])
+        frame[name + suffix] = compute_metric(frame, name, suffix).astype(dtype, copy=False)
+    return frame
@@ -0,0 +1,68 @@
+"""
+HSNW Dashboard - downsampling of dense series
+Caps the number of points sent to the browser per trace while keeping peaks and troughs.
+min_max keeps the lowest and highest reading of each bucket (extremes are never lost);
+lttb (Largest-Triangle-Three-Buckets) keeps the points that best preserve the shape of the line.
+Both return the sorted indices of the points to keep.
+"""
+import numpy as np
+
+
+def min_max(y, n_out):
+    """Indices of the min and max of n_out // 2 equal-sized buckets."""
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    n_buckets = max(n_out // 2, 1)
+    bucket_size = int(np.ceil(n / n_buckets))
+    padded = np.full(n_buckets * bucket_size, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(n_buckets, bucket_size)
+    offsets = np.arange(n_buckets) * bucket_size
+    low = np.argmin(np.where(np.isnan(buckets), np.inf, buckets), axis=1) + offsets
+    high = np.argmax(np.where(np.isnan(buckets), -np.inf, buckets), axis=1) + offsets
+    keep = np.unique(np.concatenate([[0, n - 1], low, high]))
+    return keep[keep < n]
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets; NaN points are dropped. x may be datetime64."""
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype("datetime64[ns]").astype(np.int64)
+    x = x.astype(float)
+    y = np.asarray(y, dtype=float)
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) <= n_out or n_out < 3:
+        return valid
+    x, y = x[valid], y[valid]
+    n = len(x)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_start, next_stop = edges[i + 1], (edges[i + 2] if i + 2 < len(edges) else n)
+        next_x, next_y = x[next_start:next_stop].mean(), y[next_start:next_stop].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        keep[i + 1] = previous
+    return valid[keep]
+
+
+DOWNSAMPLERS = {
+    "minmax": lambda x, y, n_out: min_max(y, n_out),
+    "lttb": lttb,
+}
+
+
+def downsample(x, y, n_out, method="minmax"):
+    """Returns x, y with at most about n_out points (unchanged if already small enough)."""
+    if n_out is None or len(y) <= n_out:
+        return x, y
+    keep = DOWNSAMPLERS[method](x, y, n_out)
+    return x[keep], y[keep]
@@ -0,0 +1,37 @@
+"""
+HSNW Dashboard - streaming export
+Serializes a sequence of DataFrame chunks as CSV or Parquet one chunk at a time, so an export is written to
+the response as it is produced and only one chunk is held in memory. Parquet chunks become row groups of the
+same file; the footer follows the last one.
+"""
+import io
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def iter_csv(chunks, empty):
+    """CSV text of the chunks; empty (a frame with no rows and the columns of the chunks) gives the header."""
+    yield empty.to_csv(index=False, date_format=DATE_FORMAT)
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=False, date_format=DATE_FORMAT)
+
+
+def iter_parquet(chunks, empty):
+    """Bytes of a Parquet file holding the chunks, written as they are produced; empty gives the schema."""
+    sink = io.BytesIO()
+    schema = pa.Schema.from_pandas(empty, preserve_index=False)
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield drain(sink)
+    yield drain(sink)
+
+
+def drain(sink):
+    # The writer keeps its own file position, so the buffer can be emptied after every row group
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
@@ -0,0 +1,117 @@
+"""
+HSNW Dashboard - regular time grid
+Aligns readings onto a regular 5-minute grid held as one contiguous float32 array of shape
+(location, timestep, measurement), with NaN and a gap mask where a location has no reading. Timestamps are
+snapped to the nearest step, and several readings of a location in the same step (e.g. from two sensors)
+are averaged. Coarser bins are then a reshape of the time axis followed by a reduction, and rolling windows
+are differences of cumulative sums, so both follow time rather than row counts and skip sensor outages.
+"""
+import numpy as np
+import pandas as pd
+
+STEP = pd.Timedelta(minutes=5)
+STEPS_PER_DAY = pd.Timedelta(days=1) // STEP
+# The grid starts half a day before the first midnight, so bins centred on midnight (see aggregate) fit
+MARGIN_STEPS = STEPS_PER_DAY // 2
+
+
+class ReadingsGrid:
+    """
+    values[location, step, measurement] of the readings at origin + step * STEP; mask[location, step] is
+    False where the location has no reading. locations are in the order of the first axis.
+    """
+    def __init__(self, values, mask, origin, locations, measurements):
+        self.values = values
+        self.mask = mask
+        self.origin = origin
+        self.locations = locations
+        self.measurements = measurements
+
+    @classmethod
+    def from_readings(cls, readings, measurements):
+        first_day = readings["Date"].min().normalize()
+        n_days = (readings["Date"].max().normalize() - first_day).days + 1
+        origin = first_day - MARGIN_STEPS * STEP
+        n_steps = (n_days + 1) * STEPS_PER_DAY
+        steps = np.floor((readings["Date"] - origin) / STEP + 0.5).to_numpy().astype(np.int64)
+        codes, locations = pd.factorize(readings["Location"], sort=True)
+        cells = codes * n_steps + steps
+        n_cells = len(locations) * n_steps
+
+        mask = np.bincount(cells, minlength=n_cells).reshape(len(locations), n_steps) > 0
+        values = np.empty((len(locations), n_steps, len(measurements)), dtype=np.float32)
+        for i, measurement in enumerate(measurements):
+            column = readings[measurement].to_numpy(dtype=np.float64)
+            valid = ~np.isnan(column)
+            sums = np.bincount(cells[valid], weights=column[valid], minlength=n_cells)
+            counts = np.bincount(cells[valid], minlength=n_cells)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                values[:, :, i] = (sums / counts).reshape(len(locations), n_steps)
+        return cls(values, mask, origin, locations, list(measurements))
+
+    def aggregate(self, width, centred=False, partial=False):
+        """
+        Mean, max and min of each measurement over bins of `width` (a divisor of a day). Bins are labelled
+        with their start, or with their centre if centred (a reading exactly halfway goes to the later bin).
+        Returns the bin labels, a (location, bin, measurement, [mean, max, min]) array and a (location, bin)
+        mask of the bins with at least one reading. With partial, the stats are [sum, count, max, min] of the
+        steps with a value (in float64), so that the bins of grids of adjacent time chunks can be combined.
+        """
+        bin_steps = width // STEP
+        start = MARGIN_STEPS - (bin_steps // 2 if centred else 0)
+        n_bins = (self.values.shape[1] - start) // bin_steps
+        stop = start + n_bins * bin_steps
+        shape = (len(self.locations), n_bins, bin_steps)
+        # Views of the grid: no copy of the readings is made
+        values = self.values[:, start:stop].reshape(shape + (len(self.measurements),))
+        mask = self.mask[:, start:stop].reshape(shape).any(axis=2)
+
+        valid = ~np.isnan(values)
+        counts = valid.sum(axis=2)
+        sums = np.sum(values, axis=2, where=valid, dtype=np.float64)
+        if partial:
+            stats = np.stack([sums, counts, np.fmax.reduce(values, axis=2), np.fmin.reduce(values, axis=2)], axis=-1)
+        else:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means = sums / counts
+            stats = np.stack([means.astype(np.float32), np.fmax.reduce(values, axis=2),
+                              np.fmin.reduce(values, axis=2)], axis=-1)
+        labels = self.origin + (start + (bin_steps // 2 if centred else 0)) * STEP + np.arange(n_bins) * width
+        return pd.DatetimeIndex(labels), stats, mask
+
+
+def get_window_bins(window, width):
+    """Number of bins of `width` in a rolling window given as a bin count or a time span such as "3h" or "1D"."""
+    if isinstance(window, int):
+        return window
+    return max(int(np.ceil(pd.Timedelta(window) / width)), 1)
+
+
+def rolling_mean(dates, values, width, window, groups=None):
+    """
+    Mean of the values in the window of `window` bins of `width` that ends at each of dates, which must be
+    labels of a regular grid of bins. Missing bins and NaN values are skipped, so a window always spans the
+    same length of time, including around sensor outages; the result is NaN where it holds no value.
+    groups (integer codes, e.g. one per location) computes the rolling mean of every group in the same pass.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values
+    ticks = np.asarray(dates, dtype="datetime64[ns]").astype(np.int64)
+    groups = np.zeros(len(values), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+    n_groups = groups.max() + 1
+    first = np.full(n_groups, np.iinfo(np.int64).max)
+    np.minimum.at(first, groups, ticks)
+    steps = (ticks - first[groups]) // pd.Timedelta(width).value
+    # Lay the groups out one after another, a window apart, so no window reaches into the previous group
+    spans = np.zeros(n_groups, dtype=np.int64)
+    np.maximum.at(spans, groups, steps)
+    positions = np.r_[0, np.cumsum(spans + 1 + window)[:-1]][groups] + steps
+
+    valid = ~np.isnan(values)
+    sums = np.bincount(positions[valid] + 1, weights=values[valid], minlength=positions.max() + 2).cumsum()
+    counts = np.bincount(positions[valid] + 1, minlength=positions.max() + 2).cumsum()
+    stop = positions + 1
+    start = np.maximum(stop - window, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (sums[stop] - sums[start]) / (counts[stop] - counts[start])
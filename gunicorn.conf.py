@@ -0,0 +1,27 @@
+"""
+gunicorn settings for sharing the dataset between workers.
+The app is loaded once in the gunicorn master and the workers share its readings and rollups copy-on-write;
+the compact (non-object) columns are never written to, so their pages stay shared. Each worker starts its
+own live ingestion thread after the fork (post_fork); once it has ingested new readings, the worker holds its
+own copy of the dataset.
+Workers serve requests from a few threads, so a long /export download neither blocks the other requests of
+its worker nor counts against the worker timeout.
+Run with: gunicorn -c gunicorn.conf.py sp24-hsnw-dash-app:server
+"""
+import os
+import sys
+
+preload_app = True
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = 120
+
+os.environ["HSNW_PRELOAD"] = "1"
+
+
+def post_fork(server, worker):
+    # Only in gunicorn workers: other forks of a worker (e.g. background callback jobs) run no ingester
+    app = sys.modules.get(worker.app.app_uri.split(":")[0])
+    if app is not None and app.LIVE_INGEST_INTERVAL is not None:
+        app.start_live_ingest()
@@ -0,0 +1,122 @@
+"""
+HSNW Dashboard - heat risk index
+Run-length encoded time of each location in each heat index risk band. The 5-minute rollup of a heat index
+metric is reduced to runs: maximal stretches of consecutive 5-minute bins of one location in the same band,
+stored as (Date = start, Location, End, Band) rows in a LocationIndex. Exceedance durations, streaks and
+first/last occurrences over a date range are then computed from the runs alone, without the readings.
+New readings only rebuild the runs around the bins they fall in (update_index).
+"""
+import numpy as np
+import pandas as pd
+import grid
+import rollups
+import derived_metrics
+
+# Heat index risk bands of the chart (°F) as (name, lower bound); the first band also holds lower values
+BANDS = [("Extreme Cold", -20), ("Very Cold", -10), ("Cold", 20), ("Cool", 40), ("Comfortable", 60),
+         ("Caution", 80), ("Extreme Caution", 90), ("Danger", 105), ("Extreme Danger", 130)]
+BAND_NAMES = [name for name, low in BANDS]
+BAND_EDGES = np.array([low for name, low in BANDS[1:]], dtype=float)
+HOUR = pd.Timedelta(hours=1)
+
+
+def get_bands(values):
+    """Band number of each value; -1 where the value is missing."""
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isnan(values), -1, np.digitize(values, BAND_EDGES)).astype(np.int8)
+
+
+def get_metric_values(frame, metric):
+    column = metric + "_mean"
+    if column in frame.columns:
+        return frame[column].to_numpy(dtype=float)
+    return derived_metrics.compute_metric(frame, metric)
+
+
+def build_runs(rows, metric):
+    """Runs of 5-minute rollup rows sorted by (Location, Date), as a frame of Date, Location, End and Band."""
+    dates = rows["Date"].to_numpy()
+    locations = rows["Location"].reset_index(drop=True)
+    bands = get_bands(get_metric_values(rows, metric))
+    if len(dates) == 0:
+        return pd.DataFrame({"Date": dates, "Location": locations, "End": dates, "Band": bands})
+    codes = pd.factorize(locations)[0]
+    starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (bands[1:] != bands[:-1]) |
+                                  (dates[1:] - dates[:-1] != grid.STEP)])
+    stops = np.r_[starts[1:], len(dates)]
+    runs = pd.DataFrame({"Date": dates[starts], "Location": locations.iloc[starts].reset_index(drop=True),
+                         "End": dates[stops - 1] + grid.STEP, "Band": bands[starts]})
+    return runs[runs["Band"] >= 0].reset_index(drop=True)
+
+
+def build_index(readings_rollups, metric):
+    """LocationIndex of the runs of metric (e.g. "Heat Index") over the whole 5-minute rollup."""
+    return rollups.LocationIndex(build_runs(readings_rollups['7'].frame, metric), presorted=True)
+
+
+def update_index(index, readings_rollups, new_readings, metric):
+    """
+    New index with the runs around the bins of new_readings rebuilt from the updated 5-minute rollup. For each
+    location, the runs touching its new bins are rebuilt along with them, so runs extended, split or joined by
+    the new readings come out right. index is left unchanged.
+    """
+    rollup = readings_rollups['7']
+    bins = rollups.get_bin_dates('7', new_readings["Date"])
+    for location, location_bins in bins.groupby(new_readings["Location"], observed=True):
+        first, stop = location_bins.min().to_datetime64(), (location_bins.max() + grid.STEP).to_datetime64()
+        # Runs of a location do not overlap, so their ends are sorted like their starts
+        start, end = index.offsets.get(location, (0, 0))
+        ends = index.frame["End"].to_numpy()[start:end]
+        touching = slice(start + np.searchsorted(ends, first, side="left"),
+                         start + np.searchsorted(index.dates[start:end], stop, side="right"))
+        if touching.start < touching.stop:
+            first = min(first, index.dates[touching.start])
+            stop = max(stop, ends[touching.stop - 1 - start])
+        rows = rollup.get_location_slices([location], first, stop - grid.STEP).get(location, rollup.frame.iloc[0:0])
+        index = index.replace_range({location: build_runs(rows, metric)}, first, stop - grid.STEP)
+    return index
+
+
+def get_runs(index, start, end, locations=None, min_band=0):
+    """Runs in min_band or above of the locations (all by default) that overlap [start, end), clipped to it."""
+    start, end = pd.Timestamp(start).to_datetime64(), pd.Timestamp(end).to_datetime64()
+    ends = index.frame["End"].to_numpy()
+    blocks = []
+    for location in (index.locations if locations is None else locations):
+        if location not in index.offsets:
+            continue
+        first, last = index.offsets[location]
+        blocks.append(index.frame.iloc[first + np.searchsorted(ends[first:last], start, side="right"):
+                                       first + np.searchsorted(index.dates[first:last], end, side="left")])
+    runs = pd.concat(blocks, ignore_index=True) if blocks else index.frame.iloc[0:0]
+    runs = runs[runs["Band"] >= min_band]
+    return runs.assign(Date=runs["Date"].clip(lower=start), End=runs["End"].clip(upper=end))
+
+
+def get_exceedance(index, start, end, min_band, locations=None):
+    """
+    Time of each location in min_band or above within [start, end): total hours, number of streaks (stretches
+    of consecutive runs in those bands), longest streak in hours, and first and last time in those bands.
+    Locations that never reached min_band have 0 hours and no first/last time.
+    """
+    runs = get_runs(index, start, end, locations, min_band)
+    location = runs["Location"]
+    new_streak = (location != location.shift()) | (runs["Date"] != runs["End"].shift())
+    streaks = runs.groupby(new_streak.cumsum()).agg(Location=("Location", "first"), Date=("Date", "min"),
+                                                    End=("End", "max"))
+    streaks["Hours"] = (streaks["End"] - streaks["Date"]) / HOUR
+    summary = streaks.groupby("Location", observed=True).agg(
+        Hours=("Hours", "sum"), Streaks=("Hours", "size"), Longest=("Hours", "max"), First=("Date", "min"),
+        Last=("End", "max"))
+    summary = summary.reindex(index.locations if locations is None else locations)
+    return summary.fillna({"Hours": 0, "Streaks": 0, "Longest": 0}).astype({"Streaks": int})
+
+
+def get_band_hours(index, start, end, locations=None):
+    """Hours of each location (rows) in each band (columns, by name) within [start, end)."""
+    runs = get_runs(index, start, end, locations)
+    hours = ((runs["End"] - runs["Date"]) / HOUR).groupby([runs["Location"], runs["Band"]], observed=True).sum()
+    hours = hours.unstack("Band").reindex(index=index.locations if locations is None else locations,
+                                          columns=range(len(BANDS)), fill_value=0.0).fillna(0.0)
+    hours.columns = BAND_NAMES
+    return hours
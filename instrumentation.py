@@ -0,0 +1,146 @@
+"""
+HSNW Dashboard - instrumentation
+Timing spans around the stages of the callbacks (slicing, derived metrics, trace building, figure
+construction), the callbacks themselves and the callback requests (which add the JSON serialization),
+kept as Prometheus histograms and served as text on /metrics.
+Spans are labelled with the metric, duration and smoothing inputs; the date range is left out to keep the
+number of series bounded. Histograms are per process, so every gunicorn worker reports its own.
+Slow callbacks can be profiled: after enable_profiling(dump_dir, threshold), every instrumented callback runs
+under cProfile and the stats of calls slower than threshold seconds are written to dump_dir.
+"""
+import os
+import sys
+import time
+import pstats
+import cProfile
+import functools
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def format_labels(names, values, extra=""):
+    labels = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with a fixed set of label names."""
+    def __init__(self, name, description, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = list(label_names)
+        self.buckets = list(buckets)
+        self.series = {} # label values -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self.lock:
+            series = self.series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {key: list(values) for key, values in self.series.items()}
+        for key, values in sorted(series.items()):
+            labels = format_labels(self.label_names, key)
+            for bound, count in zip(self.buckets + ["+Inf"], values[:-2] + values[-1:]):
+                bucket_labels = format_labels(self.label_names, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{labels} {values[-2]}")
+            lines.append(f"{self.name}_count{labels} {values[-1]}")
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram("hsnw_stage_seconds", "Time spent in each stage of the dashboard callbacks.",
+                          ["stage", "metric", "duration", "smoothen"])
+CALLBACK_SECONDS = Histogram("hsnw_callback_seconds", "Time spent in each dashboard callback.", ["callback"])
+# The whole callback request, including the JSON serialization of the result by Dash
+REQUEST_SECONDS = Histogram("hsnw_callback_request_seconds", "Time spent handling each Dash callback request.",
+                            ["output"])
+HISTOGRAMS = [STAGE_SECONDS, CALLBACK_SECONDS, REQUEST_SECONDS]
+
+
+def reset_locks():
+    # A lock held by another thread at a fork (e.g. a gthread worker forking a background job) stays taken
+    # in the child, whose spans would then block forever
+    for histogram in HISTOGRAMS:
+        histogram.lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_locks)
+
+profile_dir = None
+profile_threshold = None
+
+
+@contextmanager
+def span(stage, **tags):
+    """Time the enclosed block as one observation of stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage, **tags)
+
+
+def enable_profiling(dump_dir, threshold=1.0):
+    global profile_dir, profile_threshold
+    os.makedirs(dump_dir, exist_ok=True)
+    profile_dir, profile_threshold = dump_dir, threshold
+
+
+def dump_profile(profiler, name, seconds, args, kwargs):
+    """Write <time>-<name>-<ms>ms.prof (for pstats/snakeviz) and a .txt summary headed by the call inputs."""
+    path = os.path.join(profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{seconds * 1000:.0f}ms")
+    profiler.dump_stats(path + ".prof")
+    with open(path + ".txt", "w") as f:
+        f.write(f"{name} took {seconds:.3f}s\nargs: {args!r}\nkwargs: {kwargs!r}\n\n")
+        pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+
+
+def instrument(name):
+    """Decorator recording the duration of a callback, and profiling it when profiling is enabled."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = None
+            if profile_dir is not None:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError: # another profiler is active (Python 3.12+ allows only one)
+                    profiler = None
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                if profiler is not None:
+                    profiler.disable()
+                    if seconds >= profile_threshold:
+                        try:
+                            dump_profile(profiler, name, seconds, args, kwargs)
+                        except OSError as e:
+                            print(f"Could not write the profile of {name}: {e}", file=sys.stderr)
+                CALLBACK_SECONDS.observe(seconds, callback=name)
+        return wrapper
+    return decorator
+
+
+def render_metrics():
+    """All histograms in the Prometheus text exposition format."""
+    return "\n".join(histogram.render() for histogram in HISTOGRAMS) + "\n"
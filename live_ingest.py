@@ -0,0 +1,150 @@
+"""
+HSNW Dashboard - live ingestion
+Polls the raw readings CSV for appended rows and a drop directory for new CSV files (same format as the raw
+CSV, with a header row), validates the new readings and folds them into the in-memory readings and rollups.
+Only the bins of the affected locations and days are recomputed. Every update builds a new snapshot, which is
+handed to on_update in one piece (with the readings added, for indexes updated incrementally), so callbacks
+never see a partially updated dataset.
+Readings ingested this way are not written to the Parquet store; rebuild it with sensor_store.py. Until then,
+the CSV rows appended since the store was built are ingested again after every restart.
+"""
+import io
+import os
+import glob
+import threading
+import traceback
+import pandas as pd
+import sensor_store
+import rollups
+
+INCOMING_DIR = os.path.join(sensor_store.DATA_DIR, "incoming")
+# Readings outside these ranges are dropped as sensor errors
+VALID_RANGES = {"Temperature": (-60, 140), "Rel Humidity": (0, 100), "Dew Point": (-80, 100)}
+
+
+def validate_readings(new_readings, sensors):
+    """Drop unparseable, out-of-range and unknown-sensor rows and join the locations."""
+    new_readings = new_readings.copy()
+    new_readings["Date"] = pd.to_datetime(new_readings["Date"], errors="coerce")
+    for column in ["Sensor Id"] + list(VALID_RANGES):
+        new_readings[column] = pd.to_numeric(new_readings[column], errors="coerce")
+    new_readings = new_readings.dropna(subset=["Date", "Sensor Id"] + list(VALID_RANGES))
+    for column, (low, high) in VALID_RANGES.items():
+        new_readings = new_readings[new_readings[column].between(low, high)]
+    new_readings = new_readings.astype({"Sensor Id": sensors["Sensor Id"].dtype})
+    new_readings = pd.merge(left = new_readings, right = sensors[["Sensor Id", "Location"]], on = "Sensor Id",
+                            how = "inner")
+    return sensor_store.compact_readings(new_readings[sensor_store.READING_COLUMNS], sensors)
+
+
+def merge_readings(readings_index, new_readings):
+    """
+    Add new readings to the raw readings LocationIndex, skipping readings already present for the same sensor
+    and timestamp. Returns the new LocationIndex and the readings that were actually added.
+    """
+    first, last = new_readings["Date"].min(), new_readings["Date"].max()
+    existing = readings_index.get_slice(list(new_readings["Location"].unique()), first, last)
+    new_readings = new_readings.drop_duplicates(subset=["Sensor Id", "Date"])
+    seen = pd.MultiIndex.from_frame(existing[["Sensor Id", "Date"]])
+    new_readings = new_readings[~pd.MultiIndex.from_frame(new_readings[["Sensor Id", "Date"]]).isin(seen)]
+    if new_readings.empty:
+        return readings_index, new_readings
+
+    replacements = {}
+    for location, frame in pd.concat([existing, new_readings]).groupby("Location", observed=True):
+        replacements[location] = frame.sort_values(by="Date", kind="stable")
+    return readings_index.replace_range(replacements, first, last), new_readings
+
+
+class CsvTail:
+    """
+    New complete lines appended to a CSV file since the last read. offset is the number of bytes already
+    loaded (by default, the whole file); the lines after it are returned by the first read.
+    """
+    def __init__(self, path, offset=None):
+        self.path = path
+        if offset is None:
+            offset = os.path.getsize(path) if os.path.exists(path) else 0
+        self.offset = offset
+
+    def read_new(self):
+        if not os.path.exists(self.path):
+            return None
+        size = os.path.getsize(self.path)
+        if size < self.offset: # the file was replaced; duplicates are dropped when merging
+            self.offset = 0
+        if size == self.offset:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        chunk = chunk[:chunk.rfind(b"\n") + 1]
+        if not chunk:
+            return None
+        skiprows = 1 if self.offset == 0 else 0
+        self.offset += len(chunk)
+        return pd.read_csv(io.BytesIO(chunk), header=None, usecols=sensor_store.RAW_USECOLS, skiprows=skiprows,
+                           names=sensor_store.RAW_NAMES, dtype=str)
+
+
+class DropDirectory:
+    """CSV files added to or modified in a directory since the last read (all files on the first read)."""
+    def __init__(self, path):
+        self.path = path
+        self.seen = {}
+
+    def read_new(self):
+        frames = []
+        for filename in sorted(glob.glob(os.path.join(self.path, "*.csv"))):
+            mtime = os.path.getmtime(filename)
+            if self.seen.get(filename) == mtime:
+                continue
+            self.seen[filename] = mtime
+            frames.append(pd.read_csv(filename, header=None, usecols=sensor_store.RAW_USECOLS, skiprows=1,
+                                      names=sensor_store.RAW_NAMES, dtype=str))
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+
+class LiveIngester(threading.Thread):
+    """
+    Background thread that polls the sources every `interval` seconds and calls
+    on_update(readings_index, readings_rollups, new_readings) with the updated snapshot and the readings added
+    whenever new readings were added.
+    derive is passed to rollups.update_rollups.
+    """
+    def __init__(self, sources, sensors, readings_index, readings_rollups, on_update, interval=60, derive=None):
+        super().__init__(daemon=True, name="live-ingest")
+        self.sources = sources
+        self.sensors = sensors
+        self.readings_index = readings_index
+        self.readings_rollups = readings_rollups
+        self.on_update = on_update
+        self.interval = interval
+        self.derive = derive
+        self.stopped = threading.Event()
+
+    def poll(self):
+        """Read all sources once; returns the number of readings added."""
+        frames = [frame for frame in (source.read_new() for source in self.sources) if frame is not None]
+        if not frames:
+            return 0
+        new_readings = validate_readings(pd.concat(frames, ignore_index=True), self.sensors)
+        if new_readings.empty:
+            return 0
+        readings_index, new_readings = merge_readings(self.readings_index, new_readings)
+        if new_readings.empty:
+            return 0
+        readings_rollups = rollups.update_rollups(self.readings_rollups, readings_index, new_readings, self.derive)
+        self.readings_index, self.readings_rollups = readings_index, readings_rollups
+        self.on_update(readings_index, readings_rollups, new_readings)
+        return len(new_readings)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                traceback.print_exc()
+
+    def stop(self):
+        self.stopped.set()
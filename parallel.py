@@ -0,0 +1,40 @@
+"""
+HSNW Dashboard - process pool
+Runs the chunks of the slow ingest steps (CSV parsing, rollup aggregation) on a pool of worker processes.
+Workers are forked, so they inherit the data they share (e.g. the readings to aggregate) instead of receiving
+a pickled copy of it. Results come back in task order, so merging them does not depend on scheduling.
+Everything runs in the calling process unless HSNW_LOAD_WORKERS sets a number of processes: no speedup has been
+measured yet (see benchmarks/ingest_speedup.py).
+"""
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+shared = None
+
+
+def get_workers(workers=None):
+    """Number of processes to use: workers, else HSNW_LOAD_WORKERS, else 1. 1 without fork."""
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return 1
+    if workers is None:
+        workers = int(os.environ.get("HSNW_LOAD_WORKERS", 1))
+    return max(int(workers), 1)
+
+
+def set_shared(value):
+    global shared
+    shared = value
+
+
+def call(func, args):
+    return func(shared, *args)
+
+
+def map_chunks(func, tasks, workers, shared_value=None):
+    """[func(shared_value, *task) for task in tasks], computed on `workers` forked processes."""
+    if workers <= 1 or len(tasks) <= 1:
+        return [func(shared_value, *task) for task in tasks]
+    with ProcessPoolExecutor(min(workers, len(tasks)), mp_context=multiprocessing.get_context("fork"),
+                             initializer=set_shared, initargs=(shared_value,)) as pool:
+        return list(pool.map(call, [func] * len(tasks), tasks))
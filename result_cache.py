@@ -0,0 +1,112 @@
+"""
+HSNW Dashboard - result cache
+Memoizes callback results keyed on their normalized inputs. Results are kept in an in-process LRU cache
+bounded by entry count and approximate size, with an optional disk tier (diskcache) that all gunicorn
+workers on the same machine share.
+"""
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+def estimate_size(value):
+    """Approximate in-memory size of a cached value in bytes."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_size(item) for item in value)
+    if isinstance(value, dict): # e.g. a figure dict holding base64 typed arrays
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value.values())
+    if hasattr(value, "data") and hasattr(value, "layout"): # plotly figure
+        points = sum(len(trace.x) for trace in value.data if getattr(trace, "x", None) is not None)
+        return 16 * points + 4096
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """LRU cache of results bounded by entry count and total size, with an optional shared disk tier."""
+    def __init__(self, max_entries=256, max_bytes=256 * 2**20, disk_dir=None, disk_size_limit=2 * 2**30):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.counters = dict(hits=0, disk_hits=0, misses=0, evictions=0)
+        self.disk = None
+        if disk_dir:
+            import diskcache
+            self.disk = diskcache.Cache(disk_dir, size_limit=disk_size_limit,
+                                        eviction_policy="least-recently-used")
+
+    def get(self, key):
+        """Returns (found, value)."""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return True, self.entries[key]
+        if self.disk is not None:
+            value = self.disk.get(key, default=None, retry=True)
+            if value is not None:
+                self.set(key, value, write_disk=False)
+                with self.lock:
+                    self.counters["disk_hits"] += 1
+                return True, value
+        with self.lock:
+            self.counters["misses"] += 1
+        return False, None
+
+    def set(self, key, value, write_disk=True):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.sizes.pop(key)
+                del self.entries[key]
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                old_key, _ = self.entries.popitem(last=False)
+                self.total_bytes -= self.sizes.pop(old_key)
+                self.counters["evictions"] += 1
+        if write_disk and self.disk is not None:
+            self.disk.set(key, value, retry=True)
+
+    def get_or_compute(self, key, compute):
+        found, value = self.get(key)
+        if not found:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.total_bytes = 0
+        if self.disk is not None:
+            self.disk.clear(retry=True)
+
+    def reopen(self):
+        """
+        Reset a forked process's copy of the cache: a new lock, since another thread of the parent may have held
+        the lock at the fork, and no disk tier connection, so that the process opens its own on first use.
+        """
+        self.lock = threading.Lock()
+        if self.disk is not None:
+            self.disk.close()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters, entries=len(self.entries), bytes=self.total_bytes)
+        if self.disk is not None:
+            stats["disk_entries"] = len(self.disk)
+            stats["disk_bytes"] = self.disk.volume()
+        return stats
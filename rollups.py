@@ -0,0 +1,250 @@
+"""
+HSNW Dashboard - precomputed rollups
+Mean, max and min of each measurement per location for every option of the duration dropdown
+(weekly, daily, 12-hr, 6-hr, 3-hr, hourly and 5-min). The rollups are built once when the data is
+loaded, so the callbacks only have to slice the level they need. Each level is kept sorted by
+(Location, Date) in a LocationIndex, so slicing is a binary search per location.
+All levels but the weekly one are reductions of the readings aligned on a regular 5-minute grid (see grid.py).
+Long datasets can be aggregated in time chunks on several processes: each chunk yields the sum, count, max and
+min of every bin it covers, and the bins split across chunks are then merged, so the result does not depend on
+the chunking.
+"""
+import numpy as np
+import pandas as pd
+import grid
+import parallel
+
+MEASUREMENTS = ["Temperature", "Rel Humidity", "Dew Point"]
+AGG_COLUMNS = ["Temperature_mean", "Temperature_max", "Temperature_min",
+               "Rel Humidity_mean", "Rel Humidity_max", "Rel Humidity_min",
+               "Dew Point_mean", "Dew Point_max", "Dew Point_min"]
+
+# 12-hr, 6-hr and 3-hr averages group readings by their timestamp rounded to the nearest bin
+ROUNDED_DURATIONS = {'3': pd.Timedelta(hours=12), '4': pd.Timedelta(hours=6), '5': pd.Timedelta(hours=3)}
+# Width of the bins of each level built from the raw readings (the weekly level is built from the daily one)
+BIN_WIDTHS = {'7': grid.STEP, '6': pd.Timedelta(hours=1), '5': pd.Timedelta(hours=3),
+              '4': pd.Timedelta(hours=6), '3': pd.Timedelta(hours=12), '2': pd.Timedelta(days=1)}
+# Width of the bins of every level, e.g. for time-based rolling windows
+LEVEL_WIDTHS = dict(BIN_WIDTHS, **{'1': pd.Timedelta(days=7)})
+# Days of readings per chunk when the rollups are built on several processes
+CHUNK_DAYS = 28
+
+
+def get_level_frame(readings_grid, duration, partial=False):
+    """
+    Mean/max/min of each measurement per (Location, bin) of a level, sorted by (Location, Date).
+    With partial, the columns are the sum/count/max/min of each measurement instead (see merge_partial_levels).
+    """
+    labels, stats, mask = readings_grid.aggregate(BIN_WIDTHS[duration], centred=duration in ROUNDED_DURATIONS,
+                                                  partial=partial)
+    location_index, bin_index = np.nonzero(mask)
+    frame = pd.DataFrame({"Date": labels[bin_index], "Location": readings_grid.locations[location_index]})
+    values = stats[location_index, bin_index]
+    for i, measurement in enumerate(MEASUREMENTS):
+        for j, stat in enumerate(["sum", "count", "max", "min"] if partial else ["mean", "max", "min"]):
+            frame[f"{measurement}_{stat}"] = values[:, i, j]
+    return frame if partial else frame[["Date", "Location"] + AGG_COLUMNS]
+
+
+def get_partial_levels(shared, start, stop):
+    """Partial level frames of the readings of one chunk (rows start:stop of the chunk order)."""
+    readings, order = shared
+    readings_grid = grid.ReadingsGrid.from_readings(readings.take(order[start:stop]), MEASUREMENTS)
+    return {duration: get_level_frame(readings_grid, duration, partial=True) for duration in BIN_WIDTHS}
+
+
+def merge_partial_levels(frames):
+    """
+    Level frame of partial level frames: the rows of a (Location, Date) bin are combined into its mean (sum of
+    sums over sum of counts), max and min. Bins are sorted by (Location, Date), as in get_level_frame.
+    """
+    frame = pd.concat(frames, ignore_index=True)
+    codes = pd.factorize(frame["Location"], sort=True)[0]
+    dates = frame["Date"].to_numpy()
+    order = np.lexsort((dates, codes))
+    codes, dates = codes[order], dates[order]
+    starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (dates[1:] != dates[:-1])])
+    merged = pd.DataFrame({"Date": dates[starts],
+                           "Location": frame["Location"].iloc[order[starts]].reset_index(drop=True)})
+    for measurement in MEASUREMENTS:
+        def reduce(ufunc, stat):
+            return ufunc.reduceat(frame[f"{measurement}_{stat}"].to_numpy()[order], starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            merged[f"{measurement}_mean"] = (reduce(np.add, "sum") / reduce(np.add, "count")).astype(np.float32)
+        merged[f"{measurement}_max"] = reduce(np.fmax, "max").astype(np.float32)
+        merged[f"{measurement}_min"] = reduce(np.fmin, "min").astype(np.float32)
+    return merged[["Date", "Location"] + AGG_COLUMNS]
+
+
+def build_levels_parallel(readings, workers):
+    """
+    Level frames of the raw readings, aggregated in chunks of CHUNK_DAYS on `workers` processes. Readings are
+    assigned to chunks by the 5-minute step they snap to, so the readings of a step are never split.
+    """
+    steps = get_bin_dates('7', readings["Date"]).to_numpy()
+    first_day = steps.min().astype("datetime64[D]")
+    chunks = (steps.astype("datetime64[D]") - first_day).astype(np.int64) // CHUNK_DAYS
+    order = np.argsort(chunks, kind="stable")
+    bounds = np.searchsorted(chunks[order], np.arange(chunks.max() + 2))
+    tasks = [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if start < stop]
+    partials = parallel.map_chunks(get_partial_levels, tasks, workers, (readings, order))
+    return {duration: merge_partial_levels([levels[duration] for levels in partials]) for duration in BIN_WIDTHS}
+
+
+def get_bin_dates(duration, dates):
+    """
+    Bin label of each reading timestamp for a level built from the raw readings. As on the grid, timestamps are
+    snapped to the nearest 5-minute step first, e.g. a reading at 10:58 is in the 11:00 hourly bin.
+    """
+    dates = (dates + grid.STEP / 2).dt.floor(grid.STEP)
+    if duration == '6':
+        return dates.dt.floor(BIN_WIDTHS['6'])
+    elif duration in ROUNDED_DURATIONS:
+        # Halfway timestamps go to the later bin
+        return (dates + ROUNDED_DURATIONS[duration] / 2).dt.floor(ROUNDED_DURATIONS[duration])
+    elif duration == '2':
+        return dates.dt.normalize()
+    return dates
+
+
+def get_week_start(dates):
+    return dates - pd.to_timedelta(dates.dt.weekday, unit="D")
+
+
+def aggregate_weeks(daily):
+    # Weekly averages are averages of the daily averages, as before
+    weekly = daily.groupby([get_week_start(daily["Date"]), daily["Location"]], observed=True).agg(
+        {column: column.rsplit("_", 1)[1] for column in AGG_COLUMNS})
+    return weekly[AGG_COLUMNS].reset_index()
+
+
+class LocationIndex:
+    """
+    A rollup level sorted by (Location, Date) together with the row range of each location, so that a
+    (locations, first, last) query is a couple of binary searches per location instead of a scan of the
+    whole frame. The per-location slices are views of the sorted frame.
+    """
+    def __init__(self, frame, presorted=False):
+        if not presorted:
+            frame = frame.sort_values(by=["Location", "Date"], kind="stable").reset_index(drop=True)
+        self.frame = frame
+        self.dates = self.frame["Date"].to_numpy()
+        locations = self.frame["Location"]
+        # Compare the integer codes of categorical locations instead of the strings
+        codes = locations.cat.codes.to_numpy() if isinstance(locations.dtype, pd.CategoricalDtype) else \
+            locations.to_numpy()
+        self.offsets = {}
+        if len(codes):
+            starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+            stops = np.r_[starts[1:], len(codes)]
+            self.offsets = {locations.iat[start]: (int(start), int(stop)) for start, stop in zip(starts, stops)}
+        self.locations = list(self.offsets)
+
+    def get_location_slices(self, locations, first, last):
+        """Rows of each location with first <= Date <= last, as {location: frame view}."""
+        first, last = pd.Timestamp(first).to_datetime64(), pd.Timestamp(last).to_datetime64()
+        slices = {}
+        for location in (self.locations if locations is None else locations):
+            if location not in self.offsets:
+                continue
+            start, stop = self.offsets[location]
+            dates = self.dates[start:stop]
+            slices[location] = self.frame.iloc[start + np.searchsorted(dates, first, side="left"):
+                                               start + np.searchsorted(dates, last, side="right")]
+        return slices
+
+    def get_slice(self, locations, first, last):
+        slices = self.get_location_slices(locations, first, last)
+        if not slices:
+            return self.frame.iloc[0:0]
+        return pd.concat(list(slices.values()), ignore_index=True)
+
+    def replace_range(self, replacements, first, last):
+        """
+        New LocationIndex in which, for each location of replacements ({location: frame sorted by Date}),
+        the rows with first <= Date <= last are replaced by the given rows. The other rows are copied as is,
+        without re-sorting, and this index is left unchanged.
+        """
+        first, last = pd.Timestamp(first).to_datetime64(), pd.Timestamp(last).to_datetime64()
+        blocks = []
+        for location in sorted(set(self.locations) | set(replacements)):
+            start, stop = self.offsets.get(location, (0, 0))
+            if location not in replacements:
+                blocks.append(self.frame.iloc[start:stop])
+                continue
+            dates = self.dates[start:stop]
+            blocks.append(self.frame.iloc[start:start + np.searchsorted(dates, first, side="left")])
+            blocks.append(replacements[location])
+            blocks.append(self.frame.iloc[start + np.searchsorted(dates, last, side="right"):stop])
+        return LocationIndex(pd.concat(blocks, ignore_index=True)[self.frame.columns], presorted=True)
+
+
+def build_rollups(readings, workers=1):
+    """
+    Build the LocationIndex of each duration dropdown value's rollup. With several workers (None: see
+    parallel.get_workers), the levels are aggregated in time chunks in parallel (see build_levels_parallel).
+    """
+    workers = parallel.get_workers(workers)
+    if workers > 1 and len(readings):
+        levels = build_levels_parallel(readings, workers)
+    else:
+        readings_grid = grid.ReadingsGrid.from_readings(readings, MEASUREMENTS)
+        levels = {duration: get_level_frame(readings_grid, duration) for duration in BIN_WIDTHS}
+    rollups = {duration: LocationIndex(frame, presorted=True) for duration, frame in levels.items()}
+    rollups['1'] = LocationIndex(aggregate_weeks(rollups['2'].frame))
+    return rollups
+
+
+def update_rollups(rollups, readings_index, new_readings, derive=None):
+    """
+    Fold new raw readings into the rollups. readings_index is the LocationIndex of the raw readings that
+    already includes new_readings. Only the bins of the locations in new_readings, between the first and last
+    bin they fall in, are recomputed. derive, if given, is applied to the recomputed rows (e.g. to add the
+    derived metric columns). Returns a new dict of LocationIndex; rollups is left unchanged.
+    """
+    locations = list(new_readings["Location"].unique())
+    updated = {}
+    for duration, width in BIN_WIDTHS.items():
+        bins = get_bin_dates(duration, new_readings["Date"])
+        first, last = bins.min(), bins.max()
+        raw = readings_index.get_slice(locations, first - width, last + width)
+        rollup = get_level_frame(grid.ReadingsGrid.from_readings(raw, MEASUREMENTS), duration)
+        rollup = rollup.loc[(rollup["Date"] >= first) & (rollup["Date"] <= last)].copy()
+        updated[duration] = rollups[duration].replace_range(get_replacements(rollup, derive), first, last)
+
+    weeks = get_week_start(get_bin_dates('2', new_readings["Date"]))
+    first_week, last_week = weeks.min(), weeks.max()
+    daily = updated['2'].get_slice(locations, first_week, last_week + pd.Timedelta(days=6))
+    updated['1'] = rollups['1'].replace_range(get_replacements(aggregate_weeks(daily), derive), first_week, last_week)
+    return updated
+
+
+def get_replacements(rollup, derive):
+    if derive is not None:
+        derive(rollup)
+    return {location: frame.sort_values(by="Date") for location, frame in rollup.groupby("Location", observed=True)}
+
+
+def get_rollup_bounds(duration, start_date, end_date):
+    """First and last bin labels covering the readings from start_date 00:00 to end_date 23:59:59."""
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    if duration == '1':
+        return start - pd.Timedelta(days=start.weekday()), end.normalize()
+    elif duration == '2':
+        return start, end.normalize()
+    elif duration in ROUNDED_DURATIONS:
+        return start.round(ROUNDED_DURATIONS[duration]), end.round(ROUNDED_DURATIONS[duration])
+    elif duration == '6':
+        return start, end.floor(pd.Timedelta(hours=1))
+    return start, end
+
+
+def get_rollup_slice(rollups, duration, start_date, end_date, locations=None):
+    """
+    Rows of the rollup for `duration` between start_date and end_date ('YYYY-MM-DD') for the given
+    locations (all by default), sorted by (Location, Date).
+    Bins at the edges of the range are aggregated over the whole bin.
+    """
+    first, last = get_rollup_bounds(duration, start_date, end_date)
+    return rollups[duration].get_slice(locations, first, last)
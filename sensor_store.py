@@ -0,0 +1,174 @@
+"""
+HSNW Dashboard - sensor readings store
+Converts the raw sensor readings CSV into a columnar (Parquet) store partitioned by month and location.
+Timestamps are parsed and sensor ids are joined to their locations at ingest, so the dashboard can load
+the readings in seconds instead of parsing the CSV on every startup.
+Run `python sensor_store.py` after updating Data/iu_temp_data_truncated.csv to rebuild the store.
+"""
+import io
+import os
+import json
+import shutil
+import argparse
+import warnings
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import parallel
+
+DATA_DIR = os.environ.get("HSNW_DATA_DIR", "Data") # e.g. a synthetic dataset generated for benchmarks
+RAW_READINGS_CSV = os.path.join(DATA_DIR, "iu_temp_data_truncated.csv")
+SENSORS_CSV = os.path.join(DATA_DIR, "sensors.csv")
+STORE_DIR = os.path.join(DATA_DIR, "readings_store")
+# Metadata of the store, next to its partitions (files starting with "_" are not read as data)
+SOURCE_FILE = "_source.json"
+# Columns of the raw readings CSV that are kept, and their names
+RAW_USECOLS = [1, 2, 3, 4, 6]
+RAW_NAMES = ["Date", "Temperature", "Rel Humidity", "Dew Point", "Sensor Id"]
+READING_COLUMNS = ["Date", "Temperature", "Rel Humidity", "Dew Point", "Sensor Id", "Location"]
+# In-memory types of the readings: float32 measurements (the sensors report two decimals), int32 sensor ids
+# and categorical locations (see compact_readings)
+COMPACT_DTYPES = {"Temperature": "float32", "Rel Humidity": "float32", "Dew Point": "float32", "Sensor Id": "int32"}
+# Chunks of the raw CSV per worker process when it is parsed in parallel (more chunks balance the load)
+CHUNKS_PER_WORKER = 4
+
+
+def read_sensors(path=SENSORS_CSV):
+    sensors = pd.read_csv(path)
+    sensors = sensors[["sensorid", "name", "location", "latitude", "longitude"]]
+    sensors = sensors.rename(columns = {"sensorid": "Sensor Id", "name": "Name", "location": "Location",
+                                        "latitude": "Latitude", "longitude": "Longitude"})
+    return sensors
+
+
+def get_location_dtype(sensors):
+    """Categorical type of the Location column: every sensor location, sorted."""
+    return pd.CategoricalDtype(sorted(sensors["Location"].unique()))
+
+
+def compact_readings(readings, sensors):
+    """
+    Readings with the COMPACT_DTYPES column types and the locations as a categorical of all sensor locations,
+    so that readings loaded at different times (e.g. by live ingestion) share the same location codes.
+    """
+    readings = readings.astype(COMPACT_DTYPES)
+    readings["Location"] = readings["Location"].astype(get_location_dtype(sensors))
+    return readings
+
+
+def read_raw_readings(path=RAW_READINGS_CSV, sensors=None, compact=True, workers=1):
+    """
+    Parse the raw readings CSV and join each reading to its sensor location. With several workers (None: see
+    parallel.get_workers), the file is split into chunks of whole lines that are parsed in parallel and
+    concatenated in file order, which gives the same readings as parsing it in one piece.
+    """
+    if sensors is None:
+        sensors = read_sensors()
+    workers = parallel.get_workers(workers)
+    if workers <= 1:
+        return parse_raw_readings(path, sensors, compact, skiprows=1)
+    frames = parallel.map_chunks(parse_raw_chunk, [(path, start, stop, compact) for start, stop in
+                                                   get_csv_chunks(path, workers * CHUNKS_PER_WORKER)], workers, sensors)
+    return pd.concat(frames, ignore_index=True)
+
+
+def parse_raw_readings(source, sensors, compact, skiprows=0):
+    readings = pd.read_csv(source, header=None, usecols=RAW_USECOLS, skiprows=skiprows, names=RAW_NAMES)
+    readings["Date"] = pd.to_datetime(readings["Date"])
+    readings = pd.merge(left = readings, right = sensors[["Sensor Id", "Location"]], on = "Sensor Id", how = "inner")
+    readings = readings[READING_COLUMNS]
+    return compact_readings(readings, sensors) if compact else readings
+
+
+def get_csv_chunks(path, n_chunks):
+    """(start, stop) byte offsets of n_chunks (or fewer) ranges of whole lines of a CSV after its header line."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.readline()
+        offsets = [f.tell()]
+        for i in range(1, n_chunks):
+            f.seek(max(offsets[0] + (size - offsets[0]) * i // n_chunks - 1, offsets[-1]))
+            f.readline() # move to the start of the next line
+            offsets.append(f.tell())
+    offsets.append(size)
+    return [(start, stop) for start, stop in zip(offsets[:-1], offsets[1:]) if start < stop]
+
+
+def parse_raw_chunk(sensors, path, start, stop, compact):
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(stop - start)
+    return parse_raw_readings(io.BytesIO(data), sensors, compact)
+
+
+def build_store(raw_path=RAW_READINGS_CSV, sensors_path=SENSORS_CSV, store_dir=STORE_DIR, workers=None):
+    """
+    Rebuild the partitioned store from the raw CSV. Returns the number of readings written.
+    The size of the CSV is recorded with the store, so rows appended later can be found (see get_store_offset).
+    """
+    raw_bytes = os.path.getsize(raw_path)
+    readings = read_raw_readings(raw_path, read_sensors(sensors_path), compact=False, workers=workers)
+    readings["Month"] = readings["Date"].dt.strftime('%Y-%m')
+    if os.path.exists(store_dir):
+        shutil.rmtree(store_dir)
+    pq.write_to_dataset(pa.Table.from_pandas(readings, preserve_index=False), store_dir,
+                        partition_cols=["Month", "Location"])
+    with open(os.path.join(store_dir, SOURCE_FILE), "w") as f:
+        json.dump(dict(raw_bytes=raw_bytes), f)
+    return len(readings)
+
+
+def store_exists(store_dir=STORE_DIR):
+    return os.path.isdir(store_dir) and len(os.listdir(store_dir)) > 0
+
+
+def get_store_offset(store_dir=STORE_DIR):
+    """Bytes of the raw CSV that the store was built from; 0 for a store without the record."""
+    path = os.path.join(store_dir, SOURCE_FILE)
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return json.load(f)["raw_bytes"]
+
+
+def warn_if_stale(store_dir=STORE_DIR, raw_path=RAW_READINGS_CSV):
+    """Warn (on stderr, i.e. in the gunicorn error log) if the raw CSV was modified after the store was built."""
+    if os.path.exists(raw_path) and os.path.getmtime(raw_path) > os.path.getmtime(store_dir):
+        warnings.warn(f"{store_dir} is older than {raw_path}: the readings added since are not in the store, "
+                      f"re-run sensor_store.py", stacklevel=2)
+
+
+def load_readings(store_dir=STORE_DIR, start_date=None, end_date=None, locations=None, sensors=None, compact=True):
+    """
+    Load readings from the store. Only the month/location partitions covering the requested
+    date range (inclusive, 'YYYY-MM-DD' strings or datetimes) and locations are read.
+    With compact, the readings have the compact_readings column types (sensors defaults to sensors.csv).
+    """
+    filters = []
+    if start_date is not None:
+        start_date = pd.Timestamp(start_date)
+        filters += [("Month", ">=", start_date.strftime('%Y-%m')), ("Date", ">=", start_date)]
+    if end_date is not None:
+        end_date = pd.Timestamp(end_date)
+        if end_date == end_date.normalize():
+            end_date = end_date + pd.Timedelta(days=1) - pd.Timedelta(1, unit="ns")
+        filters += [("Month", "<=", end_date.strftime('%Y-%m')), ("Date", "<=", end_date)]
+    if locations is not None:
+        filters.append(("Location", "in", list(locations)))
+    table = pq.read_table(store_dir, filters=filters or None)
+    readings = table.to_pandas()
+    readings = readings.sort_values(by = ["Date", "Sensor Id"], kind="stable").reset_index(drop=True)
+    if compact:
+        return compact_readings(readings[READING_COLUMNS], read_sensors() if sensors is None else sensors)
+    readings["Location"] = readings["Location"].astype(str)
+    return readings[READING_COLUMNS]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the partitioned sensor readings store.")
+    parser.add_argument("--raw", default=RAW_READINGS_CSV, help="raw sensor readings CSV")
+    parser.add_argument("--sensors", default=SENSORS_CSV, help="sensor metadata CSV")
+    parser.add_argument("--store", default=STORE_DIR, help="output store directory")
+    args = parser.parse_args()
+    n = build_store(args.raw, args.sensors, args.store)
+    print(f"Wrote {n} readings to {args.store}")
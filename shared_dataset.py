@@ -0,0 +1,121 @@
+"""
+HSNW Dashboard - shared dataset snapshot
+Saves the prepared readings and rollups (with their derived metric columns) as one .npy file per column.
+Every gunicorn worker then memory-maps the files read-only instead of loading and aggregating the readings
+itself: the OS page cache holds one copy that all workers share, and a worker starts in the time it takes to
+map the files. Locations are stored as their categorical codes.
+Run `python shared_dataset.py` after rebuilding the store; a snapshot older than its source data is ignored.
+"""
+import os
+import json
+import shutil
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+import sensor_store
+import rollups
+import derived_metrics
+
+SNAPSHOT_DIR = os.path.join(sensor_store.DATA_DIR, "snapshot")
+
+
+def prepare_dataset(sensors, derive=None, workers=None):
+    """
+    Load the readings (from the store, or the raw CSV if it has not been built) and precompute every
+    aggregation level of the duration dropdown. derive, if given, is applied to each rollup frame (e.g. to add
+    the derived metric columns). The CSV parsing and the rollups run on `workers` processes (None:
+    HSNW_LOAD_WORKERS, 1 by default, see parallel.get_workers). Returns the readings LocationIndex and the dict
+    of rollup LocationIndex.
+    """
+    if sensor_store.store_exists():
+        # The whole store is loaded: every rollup level and the date picker bounds cover all the readings
+        sensor_store.warn_if_stale()
+        readings = sensor_store.load_readings(sensors=sensors)
+    else:
+        readings = sensor_store.read_raw_readings(sensors=sensors, workers=workers)
+    readings_index = rollups.LocationIndex(readings)
+    readings_rollups = rollups.build_rollups(readings_index.frame, workers)
+    if derive is not None:
+        for rollup in readings_rollups.values():
+            derive(rollup.frame)
+    return readings_index, readings_rollups
+
+
+def get_source_mtime():
+    """Last modification time of the data a snapshot is built from."""
+    source = sensor_store.STORE_DIR if sensor_store.store_exists() else sensor_store.RAW_READINGS_CSV
+    return max(os.path.getmtime(source), os.path.getmtime(sensor_store.SENSORS_CSV))
+
+
+def save_frame(frame, frame_dir):
+    """Write each column of frame to frame_dir/<i>.npy; returns the column descriptions for the metadata."""
+    os.makedirs(frame_dir)
+    columns = []
+    for i, (name, column) in enumerate(frame.items()):
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            values = column.cat.codes.to_numpy()
+            columns.append(dict(name=name, categories=list(column.cat.categories)))
+        else:
+            values = column.to_numpy()
+            columns.append(dict(name=name))
+        np.save(os.path.join(frame_dir, f"{i}.npy"), np.ascontiguousarray(values))
+    return columns
+
+
+def load_frame(frame_dir, columns):
+    """DataFrame whose columns are read-only memory maps of the files written by save_frame."""
+    data = {}
+    for i, column in enumerate(columns):
+        values = np.load(os.path.join(frame_dir, f"{i}.npy"), mmap_mode="r")
+        if "categories" in column:
+            values = pd.Categorical.from_codes(values, dtype=pd.CategoricalDtype(column["categories"]))
+        data[column["name"]] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def save_snapshot(readings_index, readings_rollups, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Write the snapshot to a temporary directory and move it into place, so workers never map a partial
+    snapshot. Workers that mapped the previous snapshot keep reading its (unlinked) files.
+    """
+    source_mtime = get_source_mtime()
+    tmp_dir = snapshot_dir + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    frames = dict(readings=readings_index, **{f"rollup-{d}": rollup for d, rollup in readings_rollups.items()})
+    meta = dict(source_mtime=source_mtime,
+                frames={name: save_frame(index.frame, os.path.join(tmp_dir, name)) for name, index in frames.items()})
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    if os.path.exists(snapshot_dir):
+        shutil.rmtree(snapshot_dir)
+    os.rename(tmp_dir, snapshot_dir)
+
+
+def load_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    """The readings LocationIndex and rollups of the snapshot, or None if there is none or it is out of date."""
+    meta_path = os.path.join(snapshot_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta["source_mtime"] < get_source_mtime():
+        warnings.warn(f"Ignoring {snapshot_dir}: it is older than the readings, re-run shared_dataset.py")
+        return None
+    if sensor_store.store_exists():
+        sensor_store.warn_if_stale()
+    frames = {name: rollups.LocationIndex(load_frame(os.path.join(snapshot_dir, name), columns), presorted=True)
+              for name, columns in meta["frames"].items()}
+    readings_index = frames.pop("readings")
+    return readings_index, {name.split("-", 1)[1]: index for name, index in frames.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the memory-mapped dataset snapshot shared by the workers.")
+    parser.add_argument("--out", default=SNAPSHOT_DIR, help="output snapshot directory")
+    args = parser.parse_args()
+    readings_index, readings_rollups = prepare_dataset(sensor_store.read_sensors(), derived_metrics.add_derived_columns)
+    save_snapshot(readings_index, readings_rollups, args.out)
+    print(f"Wrote {len(readings_index.frame)} readings and {len(readings_rollups)} rollups to {args.out}")
@@ -9,17 +9,73 @@ Assigned a different line color to each location. Reading latest sensor readings
 Fixed rolling average plotting issue.
 If you run this script locally, enter http://127.0.0.1:8050/ into browser to view viz in local machine.
 """
+import os
+import time
+import base64
+import tempfile
+import zlib
 import numpy as np
 import pandas as pd
 import plotly.express as px
-import math
-from datetime import datetime, timedelta
+import plotly.graph_objects as go
 import dash
-from dash import dcc, html
-from dash.dependencies import Input, Output
-
-ROLLING_AVERAGE_WINDOW = 4
+import flask
+from dash import dcc, html, Patch
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
+import sensor_store
+import rollups
+import grid
+import derived_metrics
+import result_cache
+import downsample
+import live_ingest
+import shared_dataset
+import instrumentation
+import export
+import heat_risk
+
+ROLLING_AVERAGE_WINDOW = 4 # bins of the selected duration, e.g. 20 minutes of 5-min readings
+# Rolling window of each smoothing option: a number of bins of the selected duration or a time span ("3h", "1D")
+SMOOTHING_WINDOWS = {'2': ROLLING_AVERAGE_WINDOW, '3': '3h', '4': '1D'}
+CACHE_DERIVED_METRICS = True # store derived metrics as extra rollup columns
+RESULT_CACHE_MAX_ENTRIES = 256
+RESULT_CACHE_MAX_BYTES = 256 * 2**20
+MAX_POINTS_PER_TRACE = 4000 # None sends every point of the series to the browser
+DOWNSAMPLE_METHOD = 'minmax' # 'minmax' or 'lttb', see downsample.py
+# Charts with more points than this are drawn with WebGL (Scattergl) and their x and y are sent as base64 typed
+# arrays instead of JSON lists; 0 always uses WebGL, None never does
+WEBGL_POINT_THRESHOLD = 20000
+RESULT_CACHE_DIR = os.environ.get("HSNW_CACHE_DIR") # set to share cached results between gunicorn workers
+LIVE_INGEST_INTERVAL = 60 # seconds between checks for new readings; None disables live ingestion
+DATA_REFRESH_INTERVAL = 60 # seconds between date picker bound refreshes in the browser
+USE_DATASET_SNAPSHOT = True # map the snapshot written by shared_dataset.py instead of aggregating, if up to date
+PRELOADED = os.environ.get("HSNW_PRELOAD") == "1" # set by gunicorn.conf.py: loaded once in the gunicorn master
+PROFILE_DIR = os.environ.get("HSNW_PROFILE_DIR") # set to write cProfile stats of slow callbacks there
+PROFILE_SLOW_SECONDS = float(os.environ.get("HSNW_PROFILE_SLOW_SECONDS", 1.0))
+BACKGROUND_CALLBACKS = True # build uncached charts in background jobs (needs dash[diskcache]); False builds them inline
+BACKGROUND_CALLBACK_DIR = os.environ.get("HSNW_BACKGROUND_DIR", os.path.join(tempfile.gettempdir(), "hsnw-background"))
+EXPORT_CHUNK_ROWS = 100000 # rows serialized at a time by /export
 monroe_county = dict(lat=39.1690, lon=-86.5200)
+loc_colors = {'Cravens Hall Bus Stop': 'maroon', 
+              'Hodge Hall Bus Stop': 'red', 
+              'Biology Building': 'purple', 
+              'Campus River': 'fuchsia', 
+              'Fee Ln': 'green', 
+              'Merrill Hall': 'lime', 
+              'Myles Brand Parking Lot': 'darkorange', 
+              'Wells Library Parking Lot': 'navy', 
+              'Woodlawn': 'blue', 
+              'Dunn Meadow': 'teal', 
+              'Dunn Woods': 'aqua', 
+              'Luddy Hall Parking Lot': 'goldenrod', 
+              'Woodlawn Field': 'coral', 
+              'Bloomington Community Orchard': 'burlywood', 
+              'Willie Streeter Community Garden': 'cadetblue', 
+              'Jordan River Auditorium': 'sienna', 
+              'Opposite Teter Quad': 'darkgray'}
+# Colours of the locations that are not in loc_colors
+location_palette = px.colors.qualitative.Dark24
 heat_index_bands = [
         dict(type='rect', y0=-20, y1=-10, fillcolor='#05014a', opacity=0.2, 
              name="Extreme Cold: Risk of frostbite and hypothermia. Dangerously cold conditions", layer='below'),
@@ -43,24 +99,83 @@ heat_index_bands = [
              name="Extreme Danger: Heat stroke highly likely. Dangerously hot conditions", layer='below'),
     ]
 
-readings = pd.read_csv("Data/iu_temp_data_truncated.csv", header=None, usecols=[1, 2, 3, 4, 6], skiprows=1, 
-                       names = ["Date", "Temperature", "Rel Humidity", "Dew Point", "Sensor Id"])
-sensors = pd.read_csv("Data/sensors.csv")
-sensors = sensors[["sensorid", "name", "location", "latitude", "longitude"]]
-sensors = sensors.rename(columns = {"sensorid": "Sensor Id", "name": "Name", "location": "Location", 
-                                    "latitude": "Latitude", "longitude": "Longitude"})
+sensors = sensor_store.read_sensors()
 sensor_locations_df = sensors[["Sensor Id", "Location"]]
 sensor_locations = dict(zip(sensors["Sensor Id"], sensors["Location"]))
-    
-readings["Date"] = pd.to_datetime(readings["Date"])
-readings = pd.merge(left = readings, right = sensor_locations_df, on = "Sensor Id", how = "inner")
 
-readings_day = readings.groupby([readings['Date'].dt.date, readings["Location"]]).agg({"Temperature":["mean", "max", "min"],
-                                    "Rel Humidity":["mean", "max", "min"],
-                                    "Dew Point":["mean", "max", "min"]}).droplevel(axis=1, level=[1]).reset_index()
-readings_day.columns = ["Date", "Location", "Temperature_mean", "Temperature_max", "Temperature_min", 
-                        "Rel Humidity_mean", "Rel Humidity_max", "Rel Humidity_min", "Dew Point_mean", 
-                        "Dew Point_max", "Dew Point_min"]
+# Map the shared snapshot if there is an up-to-date one; otherwise read the pre-parsed partitioned store
+# (built by sensor_store.py, falling back to parsing the raw CSV) and precompute every aggregation level of
+# the duration dropdown. Readings are held with compact types: float32 measurements and categorical locations
+dataset = shared_dataset.load_snapshot() if USE_DATASET_SNAPSHOT else None
+if dataset is None:
+    dataset = shared_dataset.prepare_dataset(sensors, derived_metrics.add_derived_columns if CACHE_DERIVED_METRICS 
+                                             else None)
+readings_index, readings_rollups = dataset
+readings = readings_index.frame
+
+# Heat index metrics (metric dropdown value -> field name) with a run-length encoded index of their risk bands
+HEAT_RISK_METRICS = {'4': "Heat Index", '6': "NWS Heat Index"}
+
+
+def get_heat_risk_indexes(readings_rollups, heat_risk_indexes=None, new_readings=None):
+    # Only the runs around new_readings are rebuilt when the previous indexes are given
+    if heat_risk_indexes is None:
+        return {metric: heat_risk.build_index(readings_rollups, field_name) 
+                for metric, field_name in HEAT_RISK_METRICS.items()}
+    return {metric: heat_risk.update_index(heat_risk_indexes[metric], readings_rollups, new_readings, field_name)
+            for metric, field_name in HEAT_RISK_METRICS.items()}
+
+
+heat_risk_indexes = get_heat_risk_indexes(readings_rollups)
+
+
+def get_date_bounds(readings_rollups):
+    """First and last day with readings, as dates for the date picker."""
+    dates = readings_rollups['2'].dates
+    return pd.Timestamp(dates.min()).date(), pd.Timestamp(dates.max()).date()
+
+
+def get_data_version(readings):
+    return f"{len(readings)}-{readings['Date'].max()}"
+
+
+first_day, last_day = get_date_bounds(readings_rollups)
+data_version = get_data_version(readings)
+
+
+def swap_dataset(new_readings_index, new_rollups, new_readings=None):
+    # Everything is built before the globals are rebound, so callbacks only ever see complete snapshots;
+    # data_version is part of the result cache keys, so results of the old snapshot are no longer used
+    global readings_index, readings, readings_rollups, first_day, last_day, data_version, heat_risk_indexes
+    new_date_bounds = get_date_bounds(new_rollups)
+    new_data_version = get_data_version(new_readings_index.frame)
+    if new_readings is None:
+        new_heat_risk_indexes = get_heat_risk_indexes(new_rollups)
+    else:
+        new_heat_risk_indexes = get_heat_risk_indexes(new_rollups, heat_risk_indexes, new_readings)
+    readings_index, readings, readings_rollups, (first_day, last_day), data_version, heat_risk_indexes = (
+        new_readings_index, new_readings_index.frame, new_rollups, new_date_bounds, new_data_version, 
+        new_heat_risk_indexes)
+
+
+def start_live_ingest():
+    global ingester
+    # The data was loaded from the store (or its snapshot) unless it was parsed from the whole CSV: the rows
+    # appended to the CSV since the store was built are read again
+    csv_offset = sensor_store.get_store_offset() if sensor_store.store_exists() else None
+    ingester = live_ingest.LiveIngester(
+        [live_ingest.CsvTail(sensor_store.RAW_READINGS_CSV, csv_offset),
+         live_ingest.DropDirectory(live_ingest.INCOMING_DIR)],
+        sensors, readings_index, readings_rollups, swap_dataset, LIVE_INGEST_INTERVAL,
+        derived_metrics.add_derived_columns if CACHE_DERIVED_METRICS else None)
+    ingester.start()
+
+
+ingester = None
+# Threads do not survive fork, so a preloaded app starts one ingester in each gunicorn worker instead (post_fork
+# in gunicorn.conf.py). Each ingester builds its own copy of the dataset, which is then no longer shared
+if LIVE_INGEST_INTERVAL is not None and not PRELOADED:
+    start_live_ingest()
 
 # Get the sensor subset
 sensor_subset = pd.merge(
@@ -70,28 +185,173 @@ sensor_subset.columns = ["value", "label"]
 sensor_subset_as_options = sensor_subset.to_dict('records')
 
 
+# Background jobs run in separate processes, so their results only reach the workers through a disk tier
+results_cache_dir = RESULT_CACHE_DIR
+if results_cache_dir is None and BACKGROUND_CALLBACKS:
+    results_cache_dir = os.path.join(BACKGROUND_CALLBACK_DIR, "results")
+results_cache = result_cache.ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES, results_cache_dir)
+if results_cache_dir != RESULT_CACHE_DIR:
+    results_cache.clear() # results of a previous run may come from different code
+# Forked gunicorn workers and background jobs open their own disk tier connection and get a fresh cache lock
+os.register_at_fork(after_in_child=results_cache.reopen)
+if PROFILE_DIR is not None:
+    instrumentation.enable_profiling(PROFILE_DIR, PROFILE_SLOW_SECONDS)
+
+# Background jobs run in processes forked from the worker and exchange results through a local disk cache
+background_manager = None
+if BACKGROUND_CALLBACKS:
+    import diskcache
+    background_manager = dash.DiskcacheManager(diskcache.Cache(BACKGROUND_CALLBACK_DIR))
+
 app = dash.Dash(__name__)
 server = app.server
 
 
-@app.callback(
-    Output('map-sensors', 'selectedData'),
-    Input('map-sensors', 'figure'), 
-)
-
-def get_spatial_view(figure):
-    start_date = readings_day["Date"].min()
-    end_date = readings_day["Date"].max()
-    readings_slice = readings_day.loc[(readings_day["Date"] >= start_date)
-                                        & (readings_day["Date"] <= end_date)]
-    
-    sensors_geo = readings_slice.groupby("Location").agg({"Date": ["max"], "Temperature_mean": ["mean"]})\
+@server.route("/cache-stats")
+def get_cache_stats():
+    return flask.jsonify(results_cache.stats())
+
+
+@server.route("/metrics")
+def get_metrics():
+    return flask.Response(instrumentation.render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+METRICS = ('1', '2', '3', '4', '5', '6', '7')
+EXPORT_FORMATS = {"csv": (export.iter_csv, "text/csv"), "parquet": (export.iter_parquet, "application/vnd.apache.parquet")}
+
+
+@server.route("/export")
+def export_readings():
+    """
+    Stream the readings behind the chart as CSV or Parquet, e.g. /export?metric=4&duration=7&location=Fee Ln
+    &location=Merrill Hall&start_date=2023-06-01&end_date=2023-06-30&format=parquet. metric and duration take
+    the values of the dashboard dropdowns, or duration=raw for the sensor readings; all locations and the whole
+    date range are exported by default. Values are not smoothed.
+    """
+    args = flask.request.args
+    metric, duration, file_format = args.get("metric", '1'), args.get("duration", '2'), args.get("format", "csv")
+    if metric not in METRICS:
+        flask.abort(400, f"metric must be one of {', '.join(METRICS)}")
+    if duration != 'raw' and duration not in readings_rollups:
+        flask.abort(400, f"duration must be raw or one of {', '.join(sorted(readings_rollups))}")
+    if file_format not in EXPORT_FORMATS:
+        flask.abort(400, f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    start_date, end_date = get_date_range_args(args)
+
+    chunks, empty = get_export_chunks(metric, duration, args.getlist("location") or None, start_date, end_date)
+    iter_file, mimetype = EXPORT_FORMATS[file_format]
+    filename = f"hsnw-metric{metric}-duration{duration}-{start_date}-{end_date}.{file_format}"
+    return flask.Response(iter_file(chunks, empty), mimetype=mimetype,
+                          headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+def get_date_range_args(args):
+    """start_date and end_date query parameters as dates, the whole date range by default."""
+    try:
+        start_date = pd.Timestamp(args.get("start_date", first_day))
+        end_date = pd.Timestamp(args.get("end_date", last_day))
+    except ValueError:
+        start_date = end_date = pd.NaT
+    # Empty values parse as NaT
+    if pd.isna(start_date) or pd.isna(end_date):
+        flask.abort(400, "start_date and end_date must be dates (YYYY-MM-DD)")
+    return start_date.date(), end_date.date()
+
+
+@server.route("/api/heat-risk")
+def get_heat_risk():
+    """
+    Time each location spent in a heat index risk band or above, e.g. /api/heat-risk?metric=4&band=Danger
+    &start_date=2023-06-01&end_date=2023-08-31&location=Fee Ln: total hours, streaks, longest streak, first and
+    last time, and the hours in every band. metric is 4 (Heat Index) or 6 (Heat Index (NWS)); band is one of
+    heat_risk.BAND_NAMES, Danger by default. All locations and the whole date range are covered by default.
+    """
+    args = flask.request.args
+    metric, band = args.get("metric", '4'), args.get("band", "Danger")
+    if metric not in HEAT_RISK_METRICS:
+        flask.abort(400, f"metric must be one of {', '.join(HEAT_RISK_METRICS)}")
+    if band not in heat_risk.BAND_NAMES:
+        flask.abort(400, f"band must be one of {', '.join(heat_risk.BAND_NAMES)}")
+    start_date, end_date = get_date_range_args(args)
+    exceedance, band_hours = get_heat_risk_summary(metric, band, start_date, end_date, 
+                                                   args.getlist("location") or None)
+    return flask.jsonify(metric=metric, band=band, start_date=str(start_date), end_date=str(end_date), locations=[
+        dict(location=location, hours=row.Hours, streaks=int(row.Streaks), longest_streak_hours=row.Longest,
+             first=format_iso_time(row.First), last=format_iso_time(row.Last),
+             band_hours=band_hours.loc[location].to_dict())
+        for location, row in exceedance.iterrows()])
+
+
+def get_heat_risk_summary(metric, band, start_date, end_date, locations=None):
+    """
+    Exceedance of band (see heat_risk.get_exceedance) and hours in every band of each location from start_date
+    00:00 to the end of end_date, read from the heat risk index of metric.
+    """
+    index = heat_risk_indexes[metric]
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+    with instrumentation.span("heat_risk", metric=metric):
+        return (heat_risk.get_exceedance(index, start, end, heat_risk.BAND_NAMES.index(band), locations),
+                heat_risk.get_band_hours(index, start, end, locations))
+
+
+def format_iso_time(time):
+    return None if pd.isna(time) else time.isoformat()
+
+
+def get_export_chunks(metric, duration, locations, start_date, end_date):
+    """
+    The rows of an export as a generator of frames of at most EXPORT_CHUNK_ROWS rows, sliced like
+    get_readings_slice but without copying the whole slice, and an empty frame with their columns. The
+    dataset is bound here, so a live ingestion swap does not change an export while it streams.
+    """
+    field_mean, field_name, label_name, label_value = get_metric_field_names(metric)
+    if duration == 'raw':
+        index, suffix, keys = readings_index, "", ["Date", "Location", "Sensor Id"]
+    else:
+        index, suffix, keys = readings_rollups[duration], "_mean", ["Date", "Location"]
+    first, last = rollups.get_rollup_bounds(duration, start_date, end_date)
+    slices = index.get_location_slices(locations, first, last)
+
+    def chunks():
+        for rows in slices.values():
+            for start in range(0, len(rows), EXPORT_CHUNK_ROWS):
+                yield select_metric(rows.iloc[start:start + EXPORT_CHUNK_ROWS], metric, duration, field_name, 
+                                    suffix, keys)
+    return chunks(), select_metric(index.frame.iloc[0:0], metric, duration, field_name, suffix, keys)
+
+
+@server.before_request
+def start_request_timer():
+    flask.g.request_start = time.perf_counter()
+
+
+@server.after_request
+def record_request_time(response):
+    if flask.request.path.endswith("/_dash-update-component") and "request_start" in flask.g:
+        output = (flask.request.get_json(silent=True) or {}).get("output", "")
+        instrumentation.REQUEST_SECONDS.observe(time.perf_counter() - flask.g.request_start, output=output)
+    return response
+
+
+def get_sensors_geo(start_date, end_date):
+    """
+    Average temperature of each location over the date range, with its coordinates. Size is 0 for the
+    locations that are hidden on the map because another location at the same coordinates has later readings.
+    """
+    readings_slice = rollups.get_rollup_slice(readings_rollups, '2', start_date, end_date)
+    sensors_geo = readings_slice.groupby("Location", observed=True).agg({"Date": ["max"], "Temperature_mean": ["mean"]})\
         .droplevel(axis=1,level=[1]).reset_index()
     sensors_geo = pd.merge(sensors_geo, sensors[sensors["Location"].isin(sensors_geo["Location"])], on="Location")
     sensors_geo.sort_values(by="Date", ascending=False, inplace=True)
-    sensors_geo = sensors_geo[~sensors_geo.duplicated(subset=['Latitude', 'Longitude'])]
-    sensors_geo["Size"] = 80
+    sensors_geo = sensors_geo[~sensors_geo.duplicated(subset=['Location'])]
+    sensors_geo["Size"] = np.where(sensors_geo.duplicated(subset=['Latitude', 'Longitude']), 0, 80)
     sensors_geo.columns = ['Location', 'Date', 'Temperature', 'Sensor Id', 'Name', 'Latitude', 'Longitude', 'Size']
+    return sensors_geo
+
+
+def get_spatial_view(sensors_geo):
     fig = px.scatter_mapbox(
         sensors_geo,
         lat='Latitude',
@@ -118,156 +378,203 @@ def get_spatial_view(figure):
     return fig
 
 
+# The map is built once with every location; date range changes only patch the marker colours and sizes
+map_sensors_geo = get_sensors_geo(first_day, last_day)
+
+
+@app.callback(
+    Output('map-sensors', 'selectedData'),
+    Input('map-sensors', 'figure'), 
+)
+
+@instrumentation.instrument("select_all_sensors")
+def select_all_sensors(figure):
+    # Show every location on the map in the time series chart after the map is (re)drawn
+    trace = figure['data'][0]
+    return {'points': [{'customdata': customdata} for customdata, size in 
+                       zip(trace['customdata'], trace['marker']['size']) if size > 0]}
+
+
+@app.callback(
+    Output('map-sensors', 'figure'), 
+    Input('date-picker-temperature-1', 'start_date'),
+    Input('date-picker-temperature-1', 'end_date'), 
+    prevent_initial_call=True
+)
+
+@instrumentation.instrument("update_spatial_view")
+def update_spatial_view(start_date, end_date):
+    with instrumentation.span("map_aggregate"):
+        sensors_geo = get_sensors_geo(start_date, end_date).set_index("Location")\
+            .reindex(map_sensors_geo["Location"])
+    patched = Patch()
+    patched['data'][0]['marker']['color'] = sensors_geo["Temperature"].astype(object).where(
+        sensors_geo["Temperature"].notna(), None).tolist()
+    patched['data'][0]['marker']['size'] = sensors_geo["Size"].fillna(0).astype(int).tolist()
+    return patched
+
 
 @app.callback(
-    Output('map-sensors', 'figure', allow_duplicate=True), 
     Output('Temperature-Chart', 'figure'),
+    Output('chart-state', 'data'),
+    Output('chart-request', 'data'),
+    Output('chart-served', 'data'),
     Input('map-sensors', 'selectedData'), 
     Input('sel-temperature-metric-1', 'value'),
     Input('sel-duration-temperature-2', 'value'),
     Input('sel-smoothen-temperature-1', 'value'),
     Input('date-picker-temperature-1', 'start_date'),
     Input('date-picker-temperature-1', 'end_date'), 
+    State('chart-state', 'data'),
     prevent_initial_call=True
 )
 
-def update_spatial_view_get_time_series(selectedData, metric, duration, smoothen, start_date, end_date):
-    readings_slice = readings_day.loc[(readings_day["Date"] >= datetime.strptime(start_date, '%Y-%m-%d').date())
-                                      & (readings_day["Date"] <= datetime.strptime(end_date, '%Y-%m-%d').date())]    
-    sensors_geo = readings_slice.groupby("Location").agg({"Date": ["max"], "Temperature_mean": ["mean"]})\
-        .droplevel(axis=1,level=[1]).reset_index()
-    sensors_geo = pd.merge(sensors_geo, sensors[sensors["Location"].isin(sensors_geo["Location"])], on="Location")
-    sensors_geo.sort_values(by="Date", ascending=False, inplace=True)
-    sensors_geo = sensors_geo[~sensors_geo.duplicated(subset=['Latitude', 'Longitude'])]
-    sensors_geo["Size"] = 80
-    sensors_geo.columns = ['Location', 'Date', 'Temperature', 'Sensor Id', 'Name', 'Latitude', 'Longitude', 'Size']
-    sv = px.scatter_mapbox(
-        sensors_geo,
-        lat='Latitude',
-        lon='Longitude',
-        text='Location',
-        size='Size', #Fixed Size
-        color='Temperature', 
-        color_continuous_scale=px.colors.sequential.Bluered, 
-        zoom=15,
-        center={'lat': 39.1688, 'lon': -86.5210}, 
-        size_max=9,
-        hover_name="Location",
-        hover_data=dict(Temperature=False,
-                        Date=False,
-                        Size = False,
-                        Location = False,
-                        Latitude = False,
-                        Longitude = False)
-    )
-    sv.update_layout(title={'text': 'Spatial View Colored by Average Temperature Over Selected Dates', 
-                            'font': {'size': 16}}, 
-                     mapbox_style="open-street-map", height = 750, width = 725)
-    sv.update_layout(clickmode='event+select')
-    if selectedData is not None:
-        if duration is None: duration = '2'
-        if metric is None: metric = '1'
-        if smoothen is None: smoothen = '1'
-        field_mean, field_name, label_name, label_value = get_metric_field_names(metric)
-        readings_slice = get_readings_slice(metric, duration, smoothen, start_date, end_date, field_mean, field_name)
-        locations = []
-        try:
-            for i in range(len(selectedData['points'])):
-                locations.append(selectedData['points'][i]['customdata'][3])
-        except:
-            for i in range(len(selectedData['data'][0]['customdata'])):
-                locations.append(selectedData['data'][0]['customdata'][i][3])
-        
-        loc_colors = {'Cravens Hall Bus Stop': 'maroon', 
-                      'Hodge Hall Bus Stop': 'red', 
-                      'Biology Building': 'purple', 
-                      'Campus River': 'fuchsia', 
-                      'Fee Ln': 'green', 
-                      'Merrill Hall': 'lime', 
-                      'Myles Brand Parking Lot': 'darkorange', 
-                      'Wells Library Parking Lot': 'navy', 
-                      'Woodlawn': 'blue', 
-                      'Dunn Meadow': 'teal', 
-                      'Dunn Woods': 'aqua', 
-                      'Luddy Hall Parking Lot': 'goldenrod', 
-                      'Woodlawn Field': 'coral', 
-                      'Bloomington Community Orchard': 'burlywood', 
-                      'Willie Streeter Community Garden': 'cadetblue', 
-                      'Jordan River Auditorium': 'sienna', 
-                      'Opposite Teter Quad': 'darkgray'}
-        
-        ts = px.line()
-        for loc in locations:
-            df = readings_slice[readings_slice["Location"] == loc]
-            if smoothen == '2':
-                ts.add_scatter(x=df["Date"], y=df[field_name].rolling(window=ROLLING_AVERAGE_WINDOW).mean(), 
-                               mode='lines', name=loc, line_color=loc_colors[loc])
-            else:
-                ts.add_scatter(x=df["Date"], y=df[field_name], mode='lines', name=loc, line_color=loc_colors[loc])
-        
-        ts.update_layout(
-            title=label_value,
-            yaxis=dict(showline=True, linewidth=2, linecolor='darkgray'),
-            xaxis=dict(
-                showline=True,
-                linewidth=2,
-                linecolor='darkgray',
-                rangeslider=dict(visible=True),
-                type="date",
-            ),
-        )
-    else:
-        if duration is None: duration = '2'
-        if metric is None: metric = '1'
-        if smoothen is None: smoothen = '1'
-        field_mean, field_name, label_name, label_value = get_metric_field_names(metric)
+@instrumentation.instrument("update_time_series")
+def update_time_series(selectedData, metric, duration, smoothen, start_date, end_date, chart_state):
+    if duration is None: duration = '2'
+    if metric is None: metric = '1'
+    if smoothen is None: smoothen = '1'
+    locations = get_selected_locations(selectedData)
+    if locations is None:
+        locations = sorted(readings_rollups['2'].locations)
+    inputs = [data_version, metric, duration, smoothen, start_date, end_date]
+
+    # Only the selection changed: add and remove single traces instead of sending the whole chart again.
+    # The heat index bands depend on all plotted traces, so those charts are always rebuilt.
+    # Whenever the chart is updated here, chart-served cancels a background build that is still running.
+    if chart_state is not None and chart_state["inputs"] == inputs and metric not in ('4', '6'):
+        patched, new_chart_state = get_time_series_patch(chart_state["locations"], locations, metric, duration, 
+                                                         smoothen, start_date, end_date, chart_state["webgl"])
+        return patched, new_chart_state, dash.no_update, time.time()
+
+    key = ("time_series", *inputs, tuple(locations))
+    chart_state = dict(inputs=inputs, locations=locations,
+                       downsampled=is_downsampled(locations, duration, start_date, end_date))
+    found, ts = results_cache.get(key)
+    if found:
+        return ts, dict(chart_state, webgl=is_webgl_chart(ts)), dash.no_update, time.time()
+    if background_manager is not None:
+        return dash.no_update, dash.no_update, chart_state, dash.no_update
+    with instrumentation.span("time_series", metric=metric, duration=duration, smoothen=smoothen):
+        ts = get_time_series(locations, metric, duration, smoothen, start_date, end_date)
+    results_cache.set(key, ts)
+    return ts, dict(chart_state, webgl=is_webgl_chart(ts)), dash.no_update, time.time()
 
-        readings_slice = get_readings_slice(metric, duration, smoothen, start_date, end_date, field_mean, field_name)
-
-        locations = list(np.sort(readings_day["Location"].unique()))
-        
-        loc_colors = {'Cravens Hall Bus Stop': 'maroon', 
-                      'Hodge Hall Bus Stop': 'red', 
-                      'Biology Building': 'purple', 
-                      'Campus River': 'fuchsia', 
-                      'Fee Ln': 'green', 
-                      'Merrill Hall': 'lime', 
-                      'Myles Brand Parking Lot': 'darkorange', 
-                      'Wells Library Parking Lot': 'navy', 
-                      'Woodlawn': 'blue', 
-                      'Dunn Meadow': 'teal', 
-                      'Dunn Woods': 'aqua', 
-                      'Luddy Hall Parking Lot': 'goldenrod', 
-                      'Woodlawn Field': 'coral', 
-                      'Bloomington Community Orchard': 'burlywood', 
-                      'Willie Streeter Community Garden': 'cadetblue', 
-                      'Jordan River Auditorium': 'sienna', 
-                      'Opposite Teter Quad': 'darkgray'}
-        
-        ts = px.line()
-        for loc in locations:
-            df = readings_slice[readings_slice["Location"] == loc]
-            if smoothen == '2':
-                ts.add_scatter(x=df["Date"], y=df[field_name].rolling(window=ROLLING_AVERAGE_WINDOW).mean(), 
-                               mode='lines', name=loc, line_color=loc_colors[loc])
-            else:
-                ts.add_scatter(x=df["Date"], y=df[field_name], mode='lines', name=loc, line_color=loc_colors[loc])
-        
-        ts.update_layout(
-            title=label_value,
-            yaxis=dict(showline=True, linewidth=2, linecolor='darkgray'),
-            xaxis=dict(
-                showline=True,
-                linewidth=2,
-                linecolor='darkgray',
-                rangeslider=dict(visible=True),
-                type="date",
-            ),
-        )
 
+@app.callback(
+    Output('Temperature-Chart', 'figure', allow_duplicate=True),
+    Output('chart-state', 'data', allow_duplicate=True),
+    Input('chart-request', 'data'),
+    background=BACKGROUND_CALLBACKS,
+    manager=background_manager,
+    interval=500, # ms between polls of the job from the browser
+    progress=[Output('chart-progress', 'value'), Output('chart-progress', 'max')],
+    running=[(Output('chart-progress-panel', 'style'), {'display': 'flex'}, {'display': 'none'})],
+    # A new request also cancels the running build: Dash terminates the job of the previous call
+    cancel=[Input('chart-cancel', 'n_clicks'), Input('chart-served', 'data')],
+    prevent_initial_call=True
+)
+
+@instrumentation.instrument("build_time_series")
+def build_time_series(set_progress, chart_request):
+    # Runs in a background job: the chart is not cached yet and may take long to build
+    if chart_request is None:
+        raise PreventUpdate
+    version, metric, duration, smoothen, start_date, end_date = chart_request["inputs"]
+    locations = chart_request["locations"]
+    key = ("time_series", *chart_request["inputs"], tuple(locations))
+    with instrumentation.span("time_series", metric=metric, duration=duration, smoothen=smoothen):
+        ts = results_cache.get_or_compute(key, lambda: get_time_series(
+            locations, metric, duration, smoothen, start_date, end_date, set_progress))
+    return ts, dict(chart_request, webgl=is_webgl_chart(ts))
+
+
+def get_selected_locations(selectedData):
+    if selectedData is None:
+        return None
+    locations = []
+    try:
+        for i in range(len(selectedData['points'])):
+            locations.append(selectedData['points'][i]['customdata'][3])
+    except:
+        for i in range(len(selectedData['data'][0]['customdata'])):
+            locations.append(selectedData['data'][0]['customdata'][i][3])
+    return locations
+
+
+def get_location_color(loc):
+    # Locations without a fixed colour get one picked from their name, so it is the same in every session
+    if loc in loc_colors:
+        return loc_colors[loc]
+    return location_palette[zlib.crc32(loc.encode()) % len(location_palette)]
+
+
+def get_location_traces(readings_slice, locations, field_name, smoothen, duration, webgl=None):
+    # webgl None picks the renderer from the number of points (WEBGL_POINT_THRESHOLD)
+    points = get_trace_points(readings_slice, locations, field_name, smoothen, duration)
+    if webgl is None:
+        webgl = use_webgl(sum(len(x) for x, y in points.values()))
+    if webgl:
+        # plotly.py cannot validate typed arrays, so these traces are plain dicts
+        return [dict(type='scattergl', x=encode_dates(x), y=encode_values(y), mode='lines', name=loc, 
+                     line=dict(color=get_location_color(loc))) for loc, (x, y) in points.items()]
+    return [go.Scatter(x=x, y=y, mode='lines', name=loc, line_color=get_location_color(loc)) 
+            for loc, (x, y) in points.items()]
+
+
+def use_webgl(n_points):
+    return WEBGL_POINT_THRESHOLD is not None and n_points > WEBGL_POINT_THRESHOLD
+
+
+def is_webgl_chart(figure):
+    # All location traces of a chart use the same renderer; px.line() starts the chart with an SVG trace
+    return figure['data'][-1]['type'] == 'scattergl'
+
+
+def encode_typed_array(values, dtype):
+    # plotly.js decodes {dtype, bdata} into a typed array, skipping the JSON number parsing
+    values = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    return dict(dtype=dtype, bdata=base64.b64encode(values).decode('ascii'))
+
+
+def encode_dates(dates):
+    # Numbers on a date axis are milliseconds since the epoch, shown without a time zone shift
+    return encode_typed_array(np.asarray(dates, dtype='datetime64[ms]').astype(np.float64), 'f8')
+
+
+def encode_values(values):
+    return encode_typed_array(values, 'f4')
+
+
+def get_time_series(locations, metric, duration, smoothen, start_date, end_date, set_progress=None):
+    # set_progress, if given, is called with (step, number of steps) as the chart is built
+    if set_progress is None: set_progress = lambda progress: None
+    field_mean, field_name, label_name, label_value = get_metric_field_names(metric)
+    set_progress((0, 3))
+    readings_slice = get_readings_slice(metric, duration, smoothen, start_date, end_date, field_mean, field_name,
+                                        locations)
+    set_progress((1, 3))
+
+    with instrumentation.span("traces", metric=metric, duration=duration, smoothen=smoothen):
+        ts = px.line()
+        traces = get_location_traces(readings_slice, locations, field_name, smoothen, duration)
+    set_progress((2, 3))
     
+    ts.update_layout(
+        title=label_value,
+        uirevision=f"{duration}-{start_date}-{end_date}", # keep the zoom when traces are re-fetched
+        yaxis=dict(showline=True, linewidth=2, linecolor='darkgray'),
+        xaxis=dict(
+            showline=True,
+            linewidth=2,
+            linecolor='darkgray',
+            rangeslider=dict(visible=True),
+            type="date",
+        ),
+    )
+
     show_bands = True
-    if show_bands and metric == '4':
+    if show_bands and metric in ('4', '6'):
         min_date = readings_slice["Date"].min()
         max_date = readings_slice["Date"].max()
         min_heat_index = readings_slice[field_name].min()
@@ -294,95 +601,186 @@ def update_spatial_view_get_time_series(selectedData, metric, duration, smoothen
             ts.add_shape(band)
 
     ts.update_layout(showlegend=True, yaxis=dict(autorange=True, fixedrange=False), height = 750)
-    return sv, ts
-
-
-def get_readings_slice(metric, duration, smoothen, start_date, end_date, field_mean, field_name):
-    if duration == '1': # weekly avg
-        readings_slice = readings_day.loc[(readings_day["Date"] >= datetime.strptime(start_date, '%Y-%m-%d').date())
-                                           & (readings_day["Date"] <= datetime.strptime(end_date, '%Y-%m-%d').date())].copy()
-        readings_slice['Week'] = pd.to_datetime(readings_slice['Date']).dt.to_period('W')
-        readings_slice['Week'] = readings_slice['Week'].apply(lambda x: x.start_time.date())
-        readings_slice = readings_slice.groupby([readings_slice['Week'], readings_slice["Location"]]).agg(
-            {"Temperature_mean": ["mean"], "Temperature_max": ["max"], "Temperature_min": ["min"], 
-             "Rel Humidity_mean": ["mean"], "Rel Humidity_max": ["max"], "Rel Humidity_min": ["min"],
-             "Dew Point_mean": ["mean"], "Dew Point_max": ["max"], "Dew Point_min": ["min"]}).droplevel(axis=1, 
-                                                                                                        level=[1]).reset_index()
-        readings_slice.columns = ["Date", "Location", "Temperature_mean", "Temperature_max", "Temperature_min",
-                                  "Rel Humidity_mean", "Rel Humidity_max", "Rel Humidity_min", "Dew Point_mean",
-                                  "Dew Point_max", "Dew Point_min"]
-    
-    elif duration == '2': # daily avg
-        readings_slice = readings_day.loc[(readings_day["Date"] >= datetime.strptime(start_date, '%Y-%m-%d').date())
-                                           & (readings_day["Date"] <= datetime.strptime(end_date, '%Y-%m-%d').date())]
-        
-    elif duration == '3': # 12-hr avg
-        readings_slice = readings.loc[(readings["Date"] >= datetime.strptime(start_date + " 00:00:00", '%Y-%m-%d %H:%M:%S'))
-                                      & (readings["Date"] <= datetime.strptime(end_date + " 23:59:59", '%Y-%m-%d %H:%M:%S'))].copy()
-        readings_slice["Date"] = readings_slice["Date"].dt.round('12H')
-        readings_slice["Date"] = readings_slice["Date"].dt.strftime('%Y-%m-%d %H:00:00')
-    
-    elif duration == '4': # 6-hr avg
-        readings_slice = readings.loc[(readings["Date"] >= datetime.strptime(start_date + " 00:00:00", '%Y-%m-%d %H:%M:%S'))
-                                      & (readings["Date"] <= datetime.strptime(end_date + " 23:59:59", '%Y-%m-%d %H:%M:%S'))].copy()
-        readings_slice["Date"] = readings_slice["Date"].dt.round('6H')
-        readings_slice["Date"] = readings_slice["Date"].dt.strftime('%Y-%m-%d %H:00:00')
-    
-    elif duration == '5': # 3-hr avg
-        readings_slice = readings.loc[(readings["Date"] >= datetime.strptime(start_date + " 00:00:00", '%Y-%m-%d %H:%M:%S'))
-                                      & (readings["Date"] <= datetime.strptime(end_date + " 23:59:59", '%Y-%m-%d %H:%M:%S'))].copy()
-        readings_slice["Date"] = readings_slice["Date"].dt.round('3H')
-        readings_slice["Date"] = readings_slice["Date"].dt.strftime('%Y-%m-%d %H:00:00')
-    
-    elif duration == '6': # hourly avg
-        readings_slice = readings.loc[(readings["Date"] >= datetime.strptime(start_date + " 00:00:00", '%Y-%m-%d %H:%M:%S'))
-                                      & (readings["Date"] <= datetime.strptime(end_date + " 23:59:59", '%Y-%m-%d %H:%M:%S'))].copy()
-        readings_slice["Date"] = readings_slice["Date"].dt.strftime('%Y-%m-%d %H:00:00')
-
-    elif duration == '7': # 5-min readings
-        readings_slice = readings.loc[(readings["Date"] >= datetime.strptime(start_date + " 00:00:00", '%Y-%m-%d %H:%M:%S'))
-            & (readings["Date"] <= datetime.strptime(end_date + " 23:59:59", '%Y-%m-%d %H:%M:%S'))]
-
-    if duration in ('3', '4', '5', '6', '7'):
-        readings_slice = readings_slice.groupby([readings_slice['Date'], readings_slice["Location"]]).agg(
-            {"Temperature": ["mean", "max", "min"],
-             "Rel Humidity": ["mean", "max", "min"],
-             "Dew Point": ["mean", "max", "min"]}).droplevel(axis=1, level=[1]).reset_index()
-        readings_slice.columns = ["Date", "Location", "Temperature_mean", "Temperature_max", "Temperature_min",
-                                  "Rel Humidity_mean", "Rel Humidity_max", "Rel Humidity_min", "Dew Point_mean",
-                                  "Dew Point_max", "Dew Point_min"]
-
-    if metric == '4':
-        readings_slice["Heat Index_mean"] = readings_slice.apply(lambda row: get_heat_index(row), axis=1)
-
-    if metric == '5':
-        readings_slice["Humidex_mean"] = readings_slice.apply(lambda row: get_humidex(row), axis=1)
-
-    readings_slice = readings_slice[["Date", "Location", field_mean]]
-    readings_slice.columns = ["Date", "Location", field_name]
+    if traces and isinstance(traces[0], dict):
+        ts = ts.to_dict()
+        ts['data'].extend(traces)
+    else:
+        ts.add_traces(traces)
+    return ts
+
+
+def get_time_series_patch(plotted_locations, locations, metric, duration, smoothen, start_date, end_date, webgl):
+    """
+    Patch that turns the chart of plotted_locations into the chart of locations, and the new chart state.
+    Added traces use the renderer of the chart (webgl).
+    """
+    removed = [i for i, loc in enumerate(plotted_locations) if loc not in locations]
+    added = [loc for loc in locations if loc not in plotted_locations]
+    if not removed and not added:
+        return dash.no_update, dash.no_update
+
+    patched = Patch()
+    # px.line() starts the chart with an empty trace, so the location traces start at 1
+    for i in reversed(removed):
+        del patched['data'][i + 1]
+    if added:
+        field_mean, field_name, label_name, label_value = get_metric_field_names(metric)
+        readings_slice = get_readings_slice(metric, duration, smoothen, start_date, end_date, field_mean, field_name,
+                                            added)
+        with instrumentation.span("traces", metric=metric, duration=duration, smoothen=smoothen):
+            for trace in get_location_traces(readings_slice, added, field_name, smoothen, duration, webgl):
+                patched['data'].append(trace)
+    plotted_locations = [loc for loc in plotted_locations if loc in locations] + added
+    return patched, dict(inputs=[data_version, metric, duration, smoothen, start_date, end_date],
+                         locations=plotted_locations, webgl=webgl,
+                         downsampled=is_downsampled(plotted_locations, duration, start_date, end_date))
+
+
+def get_trace_points(readings_slice, locations, field_name, smoothen, duration, x_range=None):
+    """
+    x and y of the trace of each of locations, as {location: (x, y)}. The slice is partitioned by location
+    once and every location is smoothed in the same grouped pass; rolling windows span a length of time
+    (SMOOTHING_WINDOWS), so they do not reach across sensor outages.
+    """
+    groups = readings_slice.groupby("Location", sort=False, observed=True)
+    x = readings_slice["Date"].to_numpy()
+    y = readings_slice[field_name].to_numpy()
+    if smoothen in SMOOTHING_WINDOWS:
+        width = rollups.LEVEL_WIDTHS[duration]
+        y = grid.rolling_mean(x, y, width, grid.get_window_bins(SMOOTHING_WINDOWS[smoothen], width),
+                              groups.ngroup().to_numpy())
+    indices = groups.indices
+    no_rows = np.array([], dtype=int)
+    return {loc: get_downsampled_points(x[indices.get(loc, no_rows)], y[indices.get(loc, no_rows)], x_range) 
+            for loc in locations}
+
+
+def is_downsampled(locations, duration, start_date, end_date):
+    """Whether the trace of any of locations has more points than MAX_POINTS_PER_TRACE, i.e. is downsampled."""
+    if MAX_POINTS_PER_TRACE is None:
+        return False
+    # The chart's readings slice has the rows of the rollup slice
+    first, last = rollups.get_rollup_bounds(duration, start_date, end_date)
+    slices = readings_rollups[duration].get_location_slices(locations, first, last)
+    return any(len(rows) > MAX_POINTS_PER_TRACE for rows in slices.values())
+
+
+def get_downsampled_points(x, y, x_range=None):
+    """
+    x and y downsampled to MAX_POINTS_PER_TRACE. If x_range is given, the points inside it are taken from
+    the full-resolution series and the rest of the trace stays downsampled.
+    """
+    overview_x, overview_y = downsample.downsample(x, y, MAX_POINTS_PER_TRACE, DOWNSAMPLE_METHOD)
+    if x_range is None:
+        return overview_x, overview_y
+
+    x0, x1 = pd.Timestamp(x_range[0]).to_datetime64(), pd.Timestamp(x_range[1]).to_datetime64()
+    lo, hi = np.searchsorted(x, x0, side="left"), np.searchsorted(x, x1, side="right")
+    zoomed_x, zoomed_y = downsample.downsample(x[lo:hi], y[lo:hi], MAX_POINTS_PER_TRACE, DOWNSAMPLE_METHOD)
+    before, after = overview_x < x0, overview_x > x1
+    return (np.concatenate([overview_x[before], zoomed_x, overview_x[after]]),
+            np.concatenate([overview_y[before], zoomed_y, overview_y[after]]))
+
+
+@app.callback(
+    Output('Temperature-Chart', 'figure', allow_duplicate=True),
+    Input('Temperature-Chart', 'relayoutData'),
+    State('chart-state', 'data'),
+    prevent_initial_call=True
+)
+
+@instrumentation.instrument("zoom_time_series")
+def zoom_time_series(relayoutData, chart_state):
+    # Re-fetch the zoomed x-range at full resolution; reset to the downsampled overview on autorange.
+    # Charts without a downsampled trace already hold every point
+    if not relayoutData or chart_state is None or not chart_state.get("downsampled"):
+        raise PreventUpdate
+    if 'xaxis.range[0]' in relayoutData:
+        x_range = (relayoutData['xaxis.range[0]'], relayoutData['xaxis.range[1]'])
+    elif 'xaxis.range' in relayoutData:
+        x_range = tuple(relayoutData['xaxis.range'])
+    elif relayoutData.get('xaxis.autorange'):
+        x_range = None
+    else:
+        raise PreventUpdate
+
+    version, metric, duration, smoothen, start_date, end_date = chart_state["inputs"]
+    locations = chart_state["locations"]
+    field_mean, field_name, label_name, label_value = get_metric_field_names(metric)
+    readings_slice = get_readings_slice(metric, duration, smoothen, start_date, end_date, field_mean, field_name,
+                                        locations)
+    patched = Patch()
+    with instrumentation.span("zoom_traces", metric=metric, duration=duration, smoothen=smoothen):
+        points = get_trace_points(readings_slice, locations, field_name, smoothen, duration, x_range)
+        for i, (x, y) in enumerate(points.values()):
+            # px.line() starts the chart with an empty trace, so the location traces start at 1
+            if chart_state["webgl"]:
+                x, y = encode_dates(x), encode_values(y)
+            patched['data'][i + 1]['x'] = x
+            patched['data'][i + 1]['y'] = y
+    return patched
+
+
+def get_readings_slice(metric, duration, smoothen, start_date, end_date, field_mean, field_name, locations=None):
+    # The slice does not depend on smoothing or on the order of the locations
+    key = ("readings_slice", data_version, metric, duration, start_date, end_date,
+           None if locations is None else tuple(sorted(locations)))
+    with instrumentation.span("readings_slice", metric=metric, duration=duration, smoothen=smoothen):
+        return results_cache.get_or_compute(key, lambda: compute_readings_slice(
+            metric, duration, start_date, end_date, field_mean, field_name, locations))
+
+
+def compute_readings_slice(metric, duration, start_date, end_date, field_mean, field_name, locations=None):
+    with instrumentation.span("rollup_slice", metric=metric, duration=duration):
+        readings_slice = rollups.get_rollup_slice(readings_rollups, duration, start_date, end_date, locations)
+    return select_metric(readings_slice, metric, duration, field_name)
+
+
+def select_metric(readings_slice, metric, duration, field_name, suffix="_mean", keys=("Date", "Location")):
+    """
+    The keys and the metric column (field_name + suffix, "" for raw readings) of a slice, with the metric
+    column named field_name. Derived metrics that are not stored as a column are computed.
+    """
+    column = field_name + suffix
+    if column not in readings_slice.columns:
+        with instrumentation.span("derived_metric", metric=metric, duration=duration):
+            readings_slice = readings_slice.copy()
+            readings_slice[column] = derived_metrics.compute_metric(readings_slice, field_name, suffix)
+
+    readings_slice = readings_slice[list(keys) + [column]]
+    readings_slice.columns = list(keys) + [field_name]
     
     return readings_slice
-    
 
-def get_heat_index(row):
-    temperature, humidity = row["Temperature_mean"], row["Rel Humidity_mean"]
-    c = [-42.379, 2.04901523, 10.14333127, -0.22475541, -6.83783e-3,
-         -5.481717e-2, 1.22874e-3, 8.5282e-4, -1.99e-6]
-    t2 = temperature ** 2
-    r2 = humidity ** 2
-    heat_index = c[0] + c[1]*temperature + c[2]*humidity + c[3]*temperature*humidity + c[4]*t2 + c[5]*r2 + \
-                    c[6]*t2*humidity + c[7]*temperature*r2 + c[8]*t2*r2
-    return heat_index
 
+@app.callback(
+    Output('heat-risk-table', 'children'),
+    Input('sel-heat-risk-metric', 'value'),
+    Input('sel-heat-risk-band', 'value'),
+    Input('date-picker-temperature-1', 'start_date'),
+    Input('date-picker-temperature-1', 'end_date'),
+    Input('data-refresh-interval', 'n_intervals'),
+)
+
+@instrumentation.instrument("update_heat_risk")
+def update_heat_risk(metric, band, start_date, end_date, n_intervals):
+    if metric is None: metric = '4'
+    if band is None: band = "Danger"
+    if start_date is None: start_date = first_day
+    if end_date is None: end_date = last_day
+    exceedance, band_hours = get_heat_risk_summary(metric, band, start_date, end_date)
+    exceedance = exceedance.sort_values(["Hours", "Longest"], ascending=False)
+
+    columns = ["Location", f"Hours in {band} or above", "Streaks", "Longest streak (hours)", "First", "Last"]
+    rows = [html.Tr([html.Td(location), html.Td(f"{row.Hours:.1f}"), html.Td(row.Streaks), 
+                     html.Td(f"{row.Longest:.1f}"), html.Td(format_table_time(row.First)), 
+                     html.Td(format_table_time(row.Last))]) 
+            for location, row in exceedance.iterrows()]
+    return [html.Thead(html.Tr([html.Th(column) for column in columns])), html.Tbody(rows)]
 
-def get_humidex(row):
-    temperature, dewpoint = row["Temperature_mean"], row["Dew Point_mean"]
-    temp_celsius = (temperature - 32) * 5/9
-    dewpoint_celsius = (dewpoint - 32) * 5/9
-    e = 6.11 * math.exp(5417.7530 * (1 / 273.15 - 1 / (273.15 + dewpoint_celsius)))
-    h = 0.5555 * (e - 10.0)
-    humidex = temp_celsius + h 
-    return humidex
+
+def format_table_time(time):
+    return "" if pd.isna(time) else time.strftime('%d-%b-%Y %H:%M')
 
 
 def get_metric_field_names(metric):
@@ -400,9 +798,28 @@ def get_metric_field_names(metric):
     elif metric == '5':
         field_mean, field_name = "Humidex_mean", "Humidex"
         label_name, label_value = "Humidex", "Humidex"
+    elif metric == '6':
+        field_mean, field_name = "NWS Heat Index_mean", "NWS Heat Index"
+        label_name, label_value = "NWS Heat Index", "Heat Index (NWS, with adjustments)"
+    elif metric == '7':
+        field_mean, field_name = "WBGT_mean", "WBGT"
+        label_name, label_value = "WBGT", "Estimated Wet Bulb Globe Temperature (shade)"
     return field_mean, field_name, label_name, label_value
 
 
+@app.callback(
+    Output('date-picker-temperature-1', 'min_date_allowed'),
+    Output('date-picker-temperature-1', 'max_date_allowed'),
+    Input('data-refresh-interval', 'n_intervals'),
+    prevent_initial_call=True
+)
+
+@instrumentation.instrument("update_date_picker_bounds")
+def update_date_picker_bounds(n_intervals):
+    # Follow the readings added by the live ingester
+    return first_day, last_day
+
+
 
 app.layout = html.Div([
     html.H1("Heat Sensor Network Data", style = {'font-family':'Arial','color':'blue', 'text-align':'center'}),
@@ -414,7 +831,7 @@ app.layout = html.Div([
             html.H4("Triple-click a selected point or double-click an unselected one to revert to showing all lines", 
                     style={'font-family': 'Arial', 'color': 'darkred', 'padding-left': '20px'}),
             dcc.Graph(id='map-sensors',  
-                       figure=get_spatial_view(None)), 
+                       figure=get_spatial_view(map_sensors_geo)), 
         ], 
         style={
                 'backgroundColor': 'white',
@@ -431,7 +848,9 @@ app.layout = html.Div([
                              {'label': 'Relative Humidity', 'value': '2'},
                              {'label': 'Dew Point', 'value': '3'},
                              {'label': 'Heat Index', 'value': '4'},
-                             {'label': 'Humidex', 'value': '5'}],
+                             {'label': 'Humidex', 'value': '5'},
+                             {'label': 'Heat Index (NWS)', 'value': '6'},
+                             {'label': 'Wet Bulb Globe Temp. (est.)', 'value': '7'}],
                     value='1',
                     style={'font-family':'Arial', 'font-size':'11pt', 'width': '300px'},
                 ),
@@ -450,16 +869,18 @@ app.layout = html.Div([
                 dcc.Dropdown(
                     id='sel-smoothen-temperature-1',
                     options=[{'label': 'Raw', 'value': '1'},
-                             {'label': 'Rolling Average', 'value': '2'}],
+                             {'label': 'Rolling Average', 'value': '2'},
+                             {'label': 'Rolling Average (3 hours)', 'value': '3'},
+                             {'label': 'Rolling Average (1 day)', 'value': '4'}],
                     value='1',
                     style={'font-family':'Arial', 'font-size':'11pt', 'width': '300px'},
                 ),
                 dcc.DatePickerRange(
                     id='date-picker-temperature-1',
-                    min_date_allowed=readings_day['Date'].min(),
-                    max_date_allowed=readings_day['Date'].max(),
-                    start_date=readings_day['Date'].min(),
-                    end_date=readings_day['Date'].max(),
+                    min_date_allowed=first_day,
+                    max_date_allowed=last_day,
+                    start_date=first_day,
+                    end_date=last_day,
                     display_format='DD-MMM-YYYY',
                     minimum_nights=0,
                     style={'font-family':'Arial', 'font-size':'10pt'},
@@ -467,7 +888,14 @@ app.layout = html.Div([
             ], style={'padding': '10px', 'display': 'flex', 'justify-content': 'space-between'} 
             ), 
             html.Div([
+                html.Div([
+                    html.Progress(id='chart-progress', value='0', max='3', style={'width': '300px'}),
+                    html.Button('Cancel', id='chart-cancel', style={'font-family':'Arial', 'margin-left': '10px'}),
+                ], id='chart-progress-panel', style={'display': 'none'}),
                 dcc.Graph(id='Temperature-Chart'),  
+                dcc.Store(id='chart-state'),
+                dcc.Store(id='chart-request'),
+                dcc.Store(id='chart-served'),
            
             ]), 
         ], style={
@@ -479,7 +907,37 @@ app.layout = html.Div([
     ], style={'display': 'flex', 
               'flex-direction': 'row', 
               'justify-contest': 'center'}
-    )
+    ),
+    html.Div([
+        html.H2("Heat Risk Exceedance", style={'font-family': 'Arial', 'color': 'darkred', 'padding-left': '20px'}),
+        html.H4("Time each location spent in the selected heat index risk band or above over the selected dates", 
+                style={'font-family': 'Arial', 'color': 'darkred', 'padding-left': '20px'}),
+        html.Div([
+            dcc.Dropdown(
+                id='sel-heat-risk-metric',
+                options=[{'label': 'Heat Index', 'value': '4'},
+                         {'label': 'Heat Index (NWS)', 'value': '6'}],
+                value='4',
+                style={'font-family':'Arial', 'font-size':'11pt', 'width': '300px'},
+            ),
+            dcc.Dropdown(
+                id='sel-heat-risk-band',
+                # The heat bands, from Caution up
+                options=[{'label': name, 'value': name} for name in heat_risk.BAND_NAMES[5:]],
+                value='Danger',
+                style={'font-family':'Arial', 'font-size':'11pt', 'width': '300px', 'margin-left': '10px'},
+            ),
+        ], style={'padding': '10px', 'display': 'flex'}
+        ),
+        html.Table(id='heat-risk-table', style={'font-family': 'Arial', 'font-size': '11pt', 'margin': '10px 20px'}),
+    ], style={
+              'backgroundColor': 'white', 
+              'border': '1px solid darkgray', 
+              'box-shadow': '3px 3px 3px rgba(0, 0, 0, 0.2)', 
+              'margin-top': '10px'}
+    ),
+    dcc.Interval(id='data-refresh-interval', interval=DATA_REFRESH_INTERVAL * 1000,
+                 disabled=LIVE_INGEST_INTERVAL is None),
 ])
 
 
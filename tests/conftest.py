@@ -0,0 +1,31 @@
+"""Shared fixtures of the tests: the dashboard app loaded on a small synthetic dataset."""
+import os
+import sys
+import importlib
+import importlib.util
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+import synthetic_data
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """The app module, on 3 locations over 3 days (2023-07-01 to 2023-07-03) of 5-minute readings."""
+    data_dir = str(tmp_path_factory.mktemp("data"))
+    synthetic_data.generate(data_dir, n_locations=3, start="2023-07-01", end="2023-07-03")
+    # Module constants such as sensor_store.DATA_DIR are read from the environment at import: reload the modules
+    # that other tests imported first
+    os.environ["HSNW_DATA_DIR"] = data_dir
+    os.environ["HSNW_BACKGROUND_DIR"] = str(tmp_path_factory.mktemp("background"))
+    for name in ["sensor_store", "shared_dataset", "live_ingest"]:
+        if name in sys.modules:
+            importlib.reload(sys.modules[name])
+    spec = importlib.util.spec_from_file_location("hsnw_app", os.path.join(REPO_DIR, "sp24-hsnw-dash-app.py"))
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    if app.ingester is not None:
+        app.ingester.stop()
+    return app
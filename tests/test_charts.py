@@ -0,0 +1,44 @@
+"""
+Checks the chart callbacks of the dashboard, with the app loaded on a small synthetic dataset (see conftest.py).
+Run with `python -m pytest tests`.
+"""
+import pytest
+from dash.exceptions import PreventUpdate
+
+ZOOM = {'xaxis.range[0]': "2023-07-02 00:00", 'xaxis.range[1]': "2023-07-02 12:00"}
+
+
+def get_chart_state(app, duration):
+    app.results_cache.clear()
+    figure, chart_state, chart_request, _ = app.update_time_series(
+        None, '1', duration, '1', "2023-07-01", "2023-07-03", None)
+    if chart_state is app.dash.no_update: # uncached charts are built by the background callback
+        figure, chart_state = app.build_time_series(lambda progress: None, chart_request)
+    return chart_state
+
+
+@pytest.mark.parametrize("duration", ['2', '7'])
+def test_zoom_skips_charts_without_downsampled_traces(app, duration):
+    # At most 864 5-minute readings per location, below MAX_POINTS_PER_TRACE
+    chart_state = get_chart_state(app, duration)
+    assert not chart_state["downsampled"]
+    with pytest.raises(PreventUpdate):
+        app.zoom_time_series(ZOOM, chart_state)
+
+
+def test_zoom_refetches_downsampled_traces(app, monkeypatch):
+    monkeypatch.setattr(app, "MAX_POINTS_PER_TRACE", 100)
+    chart_state = get_chart_state(app, '7')
+    assert chart_state["downsampled"]
+    patched = app.zoom_time_series(ZOOM, chart_state)
+    # The x and y of every location trace are replaced
+    assert len(patched.to_plotly_json()["operations"]) == 2 * len(chart_state["locations"])
+
+
+def test_selection_patch_updates_downsampled(app, monkeypatch):
+    monkeypatch.setattr(app, "MAX_POINTS_PER_TRACE", 100)
+    chart_state = get_chart_state(app, '7')
+    locations = chart_state["locations"][:1]
+    _, new_chart_state = app.get_time_series_patch(chart_state["locations"], locations, '1', '7', '1',
+                                                   "2023-07-01", "2023-07-03", chart_state["webgl"])
+    assert new_chart_state["downsampled"] and new_chart_state["locations"] == locations
@@ -0,0 +1,111 @@
+"""
+Checks the vectorized heat indices of derived_metrics against the scalar, row-wise formulas they replaced.
+Run with `python -m pytest tests`.
+"""
+import os
+import sys
+import math
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import derived_metrics
+
+TEMPERATURES = np.arange(-20.0, 131.0, 2.5)
+HUMIDITIES = np.arange(0.0, 100.1, 2.5)
+DEW_POINTS = np.arange(-30.0, 91.0, 2.5)
+
+
+# The row-wise functions the dashboard applied to the rollups before derived_metrics, as they were
+def get_heat_index(row):
+    temperature, humidity = row["Temperature_mean"], row["Rel Humidity_mean"]
+    c = [-42.379, 2.04901523, 10.14333127, -0.22475541, -6.83783e-3,
+         -5.481717e-2, 1.22874e-3, 8.5282e-4, -1.99e-6]
+    t2 = temperature ** 2
+    r2 = humidity ** 2
+    heat_index = c[0] + c[1]*temperature + c[2]*humidity + c[3]*temperature*humidity + c[4]*t2 + c[5]*r2 + \
+                    c[6]*t2*humidity + c[7]*temperature*r2 + c[8]*t2*r2
+    return heat_index
+
+
+def get_humidex(row):
+    temperature, dewpoint = row["Temperature_mean"], row["Dew Point_mean"]
+    temp_celsius = (temperature - 32) * 5/9
+    dewpoint_celsius = (dewpoint - 32) * 5/9
+    e = 6.11 * math.exp(5417.7530 * (1 / 273.15 - 1 / (273.15 + dewpoint_celsius)))
+    h = 0.5555 * (e - 10.0)
+    humidex = temp_celsius + h
+    return humidex
+
+
+def get_nws_heat_index(temperature, humidity):
+    """Scalar NWS heat index, step by step as in the NWS description of the algorithm."""
+    simple = 0.5 * (temperature + 61.0 + (temperature - 68.0) * 1.2 + humidity * 0.094)
+    if (simple + temperature) / 2 < 80:
+        return simple
+    heat_index = get_heat_index({"Temperature_mean": temperature, "Rel Humidity_mean": humidity})
+    if humidity < 13 and 80 <= temperature <= 112:
+        heat_index -= ((13 - humidity) / 4) * math.sqrt((17 - abs(temperature - 95)) / 17)
+    elif humidity > 85 and 80 <= temperature <= 87:
+        heat_index += ((humidity - 85) / 10) * ((87 - temperature) / 5)
+    return heat_index
+
+
+def get_grid(first, second, names):
+    first, second = np.meshgrid(first, second)
+    return pd.DataFrame({names[0]: first.ravel(), names[1]: second.ravel()})
+
+
+def test_heat_index_matches_row_formula():
+    frame = get_grid(TEMPERATURES, HUMIDITIES, ["Temperature_mean", "Rel Humidity_mean"])
+    expected = frame.apply(get_heat_index, axis=1).to_numpy()
+    np.testing.assert_allclose(derived_metrics.compute_metric(frame, "Heat Index"), expected, rtol=1e-12)
+
+
+def test_humidex_matches_row_formula():
+    frame = get_grid(TEMPERATURES, DEW_POINTS, ["Temperature_mean", "Dew Point_mean"])
+    expected = frame.apply(get_humidex, axis=1).to_numpy()
+    np.testing.assert_allclose(derived_metrics.compute_metric(frame, "Humidex"), expected, rtol=1e-12)
+
+
+def test_nws_heat_index_matches_scalar_formula():
+    frame = get_grid(TEMPERATURES, HUMIDITIES, ["Temperature", "Rel Humidity"])
+    expected = [get_nws_heat_index(t, rh) for t, rh in zip(frame["Temperature"], frame["Rel Humidity"])]
+    np.testing.assert_allclose(derived_metrics.nws_heat_index(frame["Temperature"], frame["Rel Humidity"]),
+                               expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize("temperature, humidity, expected", [
+    # Steadman's formula while its average with the temperature is below 80F
+    (75.0, 50.0, 0.5 * (75.0 + 61.0 + 7.0 * 1.2 + 50.0 * 0.094)),
+    (40.0, 90.0, 0.5 * (40.0 + 61.0 - 28.0 * 1.2 + 90.0 * 0.094)),
+    # Rothfusz regression above the cutoff, without adjustment
+    (90.0, 50.0, derived_metrics.heat_index(90.0, 50.0)),
+    # RH < 13 between 80F and 112F: lowered
+    (95.0, 10.0, derived_metrics.heat_index(95.0, 10.0) - 3 / 4),
+    (112.0, 5.0, derived_metrics.heat_index(112.0, 5.0)),
+    # RH > 85 between 80F and 87F: raised
+    (82.0, 95.0, derived_metrics.heat_index(82.0, 95.0) + 1.0),
+    (87.0, 95.0, derived_metrics.heat_index(87.0, 95.0)),
+    (90.0, 95.0, derived_metrics.heat_index(90.0, 95.0)),
+])
+def test_nws_heat_index_branches(temperature, humidity, expected):
+    assert derived_metrics.nws_heat_index(temperature, humidity) == pytest.approx(expected, rel=1e-12)
+    assert get_nws_heat_index(temperature, humidity) == pytest.approx(expected, rel=1e-12)
+
+
+def test_steadman_cutoff():
+    # (simple + T) / 2 crosses 80F between 79F and 81F at 40% RH: the formula switches there
+    below = derived_metrics.nws_heat_index(79.0, 40.0)
+    above = derived_metrics.nws_heat_index(81.0, 40.0)
+    assert below == pytest.approx(0.5 * (79.0 + 61.0 + 11.0 * 1.2 + 40.0 * 0.094))
+    assert above == pytest.approx(derived_metrics.heat_index(81.0, 40.0))
+
+
+def test_add_derived_columns_keeps_float32():
+    frame = pd.DataFrame({"Temperature_mean": np.float32([90.0, 70.0]), "Rel Humidity_mean": np.float32([60, 40]),
+                          "Dew Point_mean": np.float32([74.0, 45.0])})
+    derived_metrics.add_derived_columns(frame)
+    for name in derived_metrics.DERIVED_METRICS:
+        assert frame[name + "_mean"].dtype == np.float32
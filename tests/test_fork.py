@@ -0,0 +1,45 @@
+"""
+Checks that processes forked while a lock of the result cache or of a histogram is held (e.g. background jobs
+forked from a threaded gunicorn worker) do not block on it. Run with `python -m pytest tests`.
+"""
+import os
+import sys
+import multiprocessing
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import result_cache
+import instrumentation
+
+pytestmark = pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+
+
+def finishes_in_fork(target, timeout=10):
+    process = multiprocessing.get_context("fork").Process(target=target)
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        process.kill()
+        return False
+    return process.exitcode == 0
+
+
+def test_result_cache_after_fork():
+    cache = result_cache.ResultCache()
+
+    def job():
+        cache.reopen() # registered with os.register_at_fork by the app
+        assert cache.get_or_compute("key", lambda: 1) == 1
+
+    with cache.lock:
+        assert finishes_in_fork(job)
+
+
+def test_histograms_after_fork():
+    def job():
+        with instrumentation.span("test"):
+            pass
+        instrumentation.render_metrics()
+
+    with instrumentation.STAGE_SECONDS.lock, instrumentation.CALLBACK_SECONDS.lock:
+        assert finishes_in_fork(job)
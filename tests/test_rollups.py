@@ -0,0 +1,82 @@
+"""
+Checks that folding new readings into the rollups and the heat risk index (as live ingestion does) gives the
+same result as rebuilding them from all the readings, for readings off the 5-minute grid and back-filled ones.
+Run with `python -m pytest tests`.
+"""
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sensor_store
+import rollups
+import heat_risk
+import derived_metrics
+
+SENSORS = pd.DataFrame({"Sensor Id": [1, 2, 3], "Location": ["Fee Ln", "Dunn Woods", "Woodlawn"]})
+START = pd.Timestamp("2023-07-01") # a Saturday, so the readings span two weeks
+HEAT_RISK_METRICS = ["Heat Index", "NWS Heat Index"]
+
+
+def make_readings(sensor_ids, dates, seed):
+    rng = np.random.default_rng(seed)
+    readings = pd.DataFrame({
+        "Date": np.tile(dates, len(sensor_ids)),
+        "Temperature": rng.uniform(70, 110, len(sensor_ids) * len(dates)).round(2),
+        "Rel Humidity": rng.uniform(20, 95, len(sensor_ids) * len(dates)).round(2),
+        "Dew Point": rng.uniform(50, 80, len(sensor_ids) * len(dates)).round(2),
+        "Sensor Id": np.repeat(sensor_ids, len(dates)),
+    })
+    readings = readings.merge(SENSORS, on="Sensor Id")[sensor_store.READING_COLUMNS]
+    return sensor_store.compact_readings(readings, SENSORS)
+
+
+def build(readings):
+    readings_rollups = rollups.build_rollups(readings)
+    for rollup in readings_rollups.values():
+        derived_metrics.add_derived_columns(rollup.frame)
+    return readings_rollups
+
+
+def get_base_readings():
+    # Sensor clocks drift: readings are up to a minute off the 5-minute steps
+    dates = pd.date_range(START, START + pd.Timedelta(days=3), freq="5min", inclusive="left")
+    jitter = pd.to_timedelta(np.random.default_rng(0).integers(-60, 60, len(dates)), unit="s")
+    readings = make_readings([1, 2, 3], dates + jitter, seed=1)
+    # An outage of Dunn Woods, back-filled later
+    outage = (readings["Location"] == "Dunn Woods") & readings["Date"].between("2023-07-02 09:00", "2023-07-02 13:00")
+    return readings[~outage].reset_index(drop=True)
+
+
+NEW_READINGS = {
+    # Snapped to the next hour, 12-hr, 6-hr and 3-hr bins
+    "hour": (["2023-07-03 10:58:00"], [1]),
+    # Snapped to the next day, and to the next week (2023-07-02 is a Sunday)
+    "day": (["2023-07-02 23:58:00", "2023-07-03 23:57:40"], [1, 3]),
+    # After the last reading
+    "later": (["2023-07-04 00:01:00", "2023-07-04 05:57:31"], [2]),
+    # The outage, off the grid
+    "backfill": (list(pd.date_range("2023-07-02 09:01:30", "2023-07-02 12:59", freq="5min").astype(str)), [2]),
+}
+
+
+@pytest.mark.parametrize("case", list(NEW_READINGS))
+def test_update_matches_rebuild(case):
+    base = get_base_readings()
+    dates, sensor_ids = NEW_READINGS[case]
+    new_readings = make_readings(sensor_ids, pd.to_datetime(dates), seed=2)
+    readings_index = rollups.LocationIndex(pd.concat([base, new_readings], ignore_index=True))
+    expected = build(readings_index.frame)
+
+    base_rollups = build(rollups.LocationIndex(base).frame)
+    updated = rollups.update_rollups(base_rollups, readings_index, new_readings, derived_metrics.add_derived_columns)
+    for duration, rollup in expected.items():
+        pd.testing.assert_frame_equal(updated[duration].frame, rollup.frame, check_exact=False, rtol=1e-6,
+                                      obj=f"rollup {duration}")
+
+    for metric in HEAT_RISK_METRICS:
+        index = heat_risk.update_index(heat_risk.build_index(base_rollups, metric), updated, new_readings, metric)
+        pd.testing.assert_frame_equal(index.frame, heat_risk.build_index(expected, metric).frame,
+                                      obj=f"{metric} runs")
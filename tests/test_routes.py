@@ -0,0 +1,32 @@
+"""
+Checks the validation of the query parameters of the dashboard's HTTP routes, with the app loaded on a small
+synthetic dataset (see conftest.py). Run with `python -m pytest tests`.
+"""
+import pytest
+
+
+@pytest.fixture(scope="module")
+def client(app):
+    return app.server.test_client()
+
+
+@pytest.mark.parametrize("query", ["start_date=", "end_date=", "start_date=not-a-date", "end_date=2023-13-01"])
+def test_export_rejects_bad_dates(client, query):
+    assert client.get(f"/export?{query}").status_code == 400
+
+
+def test_export(client):
+    response = client.get("/export?metric=1&duration=2&start_date=2023-07-01&end_date=2023-07-02")
+    assert response.status_code == 200
+    assert len(response.get_data(as_text=True).splitlines()) == 1 + 3 * 2
+
+
+@pytest.mark.parametrize("query", ["end_date=", "start_date=", "start_date=not-a-date", "metric=1", "band=Hot"])
+def test_heat_risk_rejects_bad_parameters(client, query):
+    assert client.get(f"/api/heat-risk?{query}").status_code == 400
+
+
+def test_heat_risk(client):
+    response = client.get("/api/heat-risk?metric=4&band=Comfortable&start_date=2023-07-01&end_date=2023-07-03")
+    assert response.status_code == 200
+    assert len(response.get_json()["locations"]) == 3